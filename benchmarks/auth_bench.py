@@ -0,0 +1,94 @@
+"""セッション認証 (session_token の検証) のマイクロベンチマーク
+
+以前の実装 (毎回 python-jose でデコード・HMAC検証) と、検証済みトークンのキャッシュを使う
+現在の get_current_user を、1回あたりの時間で比較する。
+
+    python -m benchmarks.auth_bench --calls 50000
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+class FakeRequest:
+    """get_current_user が参照する cookies だけを持つリクエスト"""
+
+    def __init__(self, token: str):
+        self.cookies = {"session_token": token}
+
+
+def measure(func, arg, calls: int) -> float:
+    """1回あたりの時間 (マイクロ秒)"""
+    for _ in range(min(1000, calls)):
+        func(arg)
+    start = time.perf_counter()
+    for _ in range(calls):
+        func(arg)
+    return (time.perf_counter() - start) / calls * 1_000_000
+
+
+def run(calls: int, users: int):
+    os.chdir(ROOT)
+    sys.path.insert(0, str(ROOT))
+    os.environ.setdefault("SESSION_SECRET", "benchmark-secret")
+    from jose import jwt
+    from utils import auth
+
+    expiration = datetime.utcnow() + timedelta(hours=24)
+    tokens = [
+        jwt.encode({"discord_id": str(100000000000000000 + i), "exp": expiration},
+                   auth.SECRET_KEY, algorithm=auth.ALGORITHM)
+        for i in range(users)
+    ]
+
+    def legacy(request):
+        """比較用: 以前の get_current_user と同じ処理"""
+        payload = jwt.decode(request.cookies["session_token"], auth.SECRET_KEY,
+                             algorithms=["HS256"], options={"verify_exp": True})
+        return payload.get("discord_id")
+
+    def uncached(request):
+        auth._verified_tokens.clear()
+        return auth.get_current_user(request)
+
+    requests = [FakeRequest(token) for token in tokens]
+    rotation = iter(())
+
+    def next_request(_):
+        nonlocal rotation
+        try:
+            return next(rotation)
+        except StopIteration:
+            rotation = iter(requests)
+            return next(rotation)
+
+    cases = [
+        ("python-jose (以前)", lambda _: legacy(next_request(None))),
+        ("キャッシュなし (初回検証)", lambda _: uncached(next_request(None))),
+        ("キャッシュあり", lambda _: auth.get_current_user(next_request(None))),
+    ]
+
+    print(f"{'case':<28}{'µs/call':>10}")
+    baseline = None
+    for name, func in cases:
+        per_call = measure(func, None, calls)
+        baseline = baseline or per_call
+        print(f"{name:<28}{per_call:>10.2f}  x{baseline / per_call:.1f}")
+    print(f"\nトークン数: {users}  キャッシュ: hits={auth._verified_tokens.hits} misses={auth._verified_tokens.misses}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="セッション認証のマイクロベンチマーク")
+    parser.add_argument("--calls", type=int, default=50000)
+    parser.add_argument("--users", type=int, default=1000)
+    args = parser.parse_args()
+    run(args.calls, args.users)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,374 @@
+"""ベンチマーク用のインメモリ Supabase 互換バックエンド
+
+supabase-py のクエリビルダーのうち、このリポジトリで使っているメソッドだけを実装する。
+execute() ごとに指定した時間だけ待つことで、実際のネットワーク往復を再現する。
+"""
+import copy
+import itertools
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from types import SimpleNamespace
+
+
+def _coerce(left, right):
+    """比較用に型をそろえる (数値として比較できる場合は数値で比較)"""
+    if isinstance(left, bool) or isinstance(right, bool):
+        return str(left).lower(), str(right).lower()
+    try:
+        # Discord ID のような18桁の整数も正確に比べられるよう Decimal を使う
+        return Decimal(str(left)), Decimal(str(right))
+    except (InvalidOperation, ValueError):
+        return str(left), str(right)
+
+
+def _compare(op, value, target):
+    if op == "is":
+        if str(target).lower() == "null":
+            return value is None
+        return value is not None and str(value).lower() == str(target).lower()
+    if value is None:
+        return False
+    if op == "eq":
+        left, right = _coerce(value, target)
+        return left == right
+    if op == "neq":
+        left, right = _coerce(value, target)
+        return left != right
+    left, right = _coerce(value, target)
+    return {"gt": left > right, "gte": left >= right, "lt": left < right, "lte": left <= right}[op]
+
+
+def _split_top_level(expression):
+    """括弧の外側のカンマで分割"""
+    parts, depth, current = [], 0, ""
+    for char in expression:
+        if char == "," and depth == 0:
+            parts.append(current)
+            current = ""
+            continue
+        depth += (char == "(") - (char == ")")
+        current += char
+    parts.append(current)
+    return parts
+
+
+def _parse_or(expression):
+    """or_() の "col.op.value,and(col.op.value,...)" 形式を条件 (row -> bool) のリストに変換"""
+    conditions = []
+    for part in _split_top_level(expression):
+        if part.startswith("and(") and part.endswith(")"):
+            group = _parse_or(part[4:-1])
+            conditions.append(lambda row, group=group: all(condition(row) for condition in group))
+            continue
+        column, op, value = part.split(".", 2)
+        conditions.append(lambda row, column=column, op=op, value=value: _compare(op, row.get(column), value))
+    return conditions
+
+
+class FakeQuery:
+    def __init__(self, backend, table):
+        self.backend = backend
+        self.table = table
+        self.operation = "select"
+        self.payload = None
+        self.filters = []
+        self.order_by = []
+        self.limit_count = None
+        self.single_row = False
+        self.count_mode = None
+
+    # ---- 操作 ----
+
+    def select(self, columns="*", count=None):
+        self.operation = "select"
+        self.columns = columns
+        self.count_mode = count
+        return self
+
+    def insert(self, payload):
+        self.operation = "insert"
+        self.payload = payload
+        return self
+
+    def upsert(self, payload):
+        self.operation = "insert"
+        self.payload = payload
+        return self
+
+    def update(self, payload):
+        self.operation = "update"
+        self.payload = payload
+        return self
+
+    def delete(self):
+        self.operation = "delete"
+        return self
+
+    # ---- フィルタ ----
+
+    def _add(self, fn):
+        self.filters.append(fn)
+        return self
+
+    def eq(self, column, value):
+        return self._add(lambda row: _compare("eq", row.get(column), value))
+
+    def neq(self, column, value):
+        return self._add(lambda row: _compare("neq", row.get(column), value))
+
+    def gt(self, column, value):
+        return self._add(lambda row: _compare("gt", row.get(column), value))
+
+    def gte(self, column, value):
+        return self._add(lambda row: _compare("gte", row.get(column), value))
+
+    def lt(self, column, value):
+        return self._add(lambda row: _compare("lt", row.get(column), value))
+
+    def lte(self, column, value):
+        return self._add(lambda row: _compare("lte", row.get(column), value))
+
+    def is_(self, column, value):
+        return self._add(lambda row: _compare("is", row.get(column), value))
+
+    def in_(self, column, values):
+        targets = {str(value) for value in values}
+        return self._add(lambda row: str(row.get(column)) in targets)
+
+    def contains(self, column, values):
+        return self._add(lambda row: all(value in (row.get(column) or []) for value in values))
+
+    def ilike(self, column, pattern):
+        regex = re.compile(
+            "^" + ".*".join(re.escape(part) for part in pattern.split("%")) + "$",
+            re.IGNORECASE | re.DOTALL
+        )
+        return self._add(lambda row: bool(regex.match(str(row.get(column) or ""))))
+
+    def or_(self, expression):
+        conditions = _parse_or(expression)
+        return self._add(lambda row: any(condition(row) for condition in conditions))
+
+    def order(self, column, desc=False):
+        self.order_by.append((column, desc))
+        return self
+
+    def limit(self, count):
+        self.limit_count = count
+        return self
+
+    def single(self):
+        self.single_row = True
+        return self
+
+    # ---- 実行 ----
+
+    def _select_columns(self, row):
+        columns = getattr(self, "columns", "*")
+        if columns == "*":
+            return copy.deepcopy(row)
+        return {name.strip(): copy.deepcopy(row.get(name.strip())) for name in columns.split(",")}
+
+    def execute(self):
+        self.backend.wait()
+        with self.backend.lock:
+            rows = self.backend.tables.setdefault(self.table, [])
+            matched = [row for row in rows if all(fn(row) for fn in self.filters)]
+
+            if self.operation == "insert":
+                payloads = self.payload if isinstance(self.payload, list) else [self.payload]
+                data = []
+                for payload in payloads:
+                    row = self.backend.new_row(self.table, payload)
+                    rows.append(row)
+                    data.append(copy.deepcopy(row))
+                return SimpleNamespace(data=data, count=None)
+
+            if self.operation == "update":
+                for row in matched:
+                    row.update(copy.deepcopy(self.payload))
+                return SimpleNamespace(data=copy.deepcopy(matched), count=None)
+
+            if self.operation == "delete":
+                ids = {id(row) for row in matched}
+                rows[:] = [row for row in rows if id(row) not in ids]
+                return SimpleNamespace(data=matched, count=None)
+
+            for column, desc in reversed(self.order_by):
+                matched.sort(key=lambda row: (row.get(column) is None, row.get(column)), reverse=desc)
+            count = len(matched) if self.count_mode else None
+            if self.limit_count is not None:
+                matched = matched[:self.limit_count]
+            data = [self._select_columns(row) for row in matched]
+
+        if self.single_row:
+            if len(data) != 1:
+                raise RuntimeError(f"{self.table}: single() で {len(data)} 行が返されました")
+            return SimpleNamespace(data=data[0], count=count)
+        return SimpleNamespace(data=data, count=count)
+
+
+class FakeSupabase:
+    """create_client() の代わりに使うインメモリのクライアント"""
+
+    def __init__(self, latency_ms: float = 20.0, jitter_ms: float = 5.0, seed: int = 0):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.tables = {}
+        self._ids = {}
+        self.calls = 0
+
+    def wait(self):
+        """1往復分の遅延 (supabase-py は同期クライアントなのでブロッキングで待つ)
+
+        ルートは async def から同期クライアントを直接呼ぶため、本番と同じくこの待ちの間は
+        イベントループが止まる。負荷テストの同時実行数は DB 待ちの重なりではなく、
+        ループ上で直列化された待ち行列の長さとして結果に表れる。
+        """
+        self.calls += 1
+        delay = self.latency + self.random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def new_row(self, table, payload):
+        row = copy.deepcopy(payload)
+        counter = self._ids.setdefault(table, itertools.count(len(self.tables.get(table, [])) + 1))
+        row.setdefault("id", next(counter))
+        row.setdefault("created_at", datetime.utcnow().isoformat())
+        if table == "players":
+            row.setdefault("gold", 0)
+            row.setdefault("inventory", [])
+            row.setdefault("bot_banned", False)
+            row.setdefault("web_banned", False)
+        return row
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    from_ = table
+
+
+ITEMS = ["鉄の剣", "木の盾", "回復薬", "魔法の杖", "銀の指輪", "革の鎧", "ドラゴンの鱗", "エリクサー"]
+
+
+def seed_data(client: FakeSupabase, players: int = 1000, trades: int = 3000, posts: int = 500,
+              messages: int = 5000):
+    """それらしいデータを投入 (最初のプレイヤーを計測用ユーザーとして使う)"""
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    user_ids = [str(100000000000000000 + i) for i in range(players)]
+
+    def ago(minutes):
+        return (now - timedelta(minutes=minutes)).isoformat()
+
+    client.tables["players"] = [
+        {
+            "id": i + 1,
+            "user_id": user_id,
+            "gold": rng.choice([0, 50, 500, 5000, 50000, 500000]),
+            "inventory": rng.sample(ITEMS, 4),
+            "equipped_weapon": "鉄の剣",
+            "equipped_armor": "革の鎧",
+            "bot_banned": False,
+            "web_banned": False,
+            "created_at": ago(rng.randint(0, 100000)),
+            "updated_at": ago(rng.randint(0, 1000))
+        }
+        for i, user_id in enumerate(user_ids)
+    ]
+    client.tables["trades"] = [
+        {
+            "id": i + 1,
+            "sender_id": rng.choice(user_ids[:50]),
+            "receiver_id": rng.choice(user_ids),
+            "item_name": rng.choice(ITEMS),
+            "item_type": "item",
+            "status": rng.choice(["pending", "receiver_accepted", "completed", "rejected", "expired"]),
+            "created_at": ago(rng.randint(0, 50000))
+        }
+        for i in range(trades)
+    ]
+    client.tables["trade_posts"] = [
+        {
+            "id": i + 1,
+            "user_id": rng.choice(user_ids),
+            "title": f"交換募集 {i + 1}",
+            "offering_items": rng.sample(ITEMS, 2),
+            "wanting_items": "、".join(rng.sample(ITEMS, 2)),
+            "message": "よろしくお願いします",
+            "created_at": ago(posts - i),
+            "expires_at": (now + timedelta(days=rng.randint(1, 7))).isoformat(),
+            "deleted_at": None,
+            "deleted_by": None
+        }
+        for i in range(posts)
+    ]
+    client.tables["direct_messages"] = [
+        {
+            "id": i + 1,
+            "sender_id": rng.choice(user_ids[:100]),
+            "receiver_id": rng.choice(user_ids[:100]),
+            "message": f"{rng.choice(ITEMS)}を交換しませんか？ #{i + 1}",
+            "created_at": ago(messages - i),
+            "is_read": rng.random() < 0.7,
+            "read_at": None,
+            "sender_deleted": False,
+            "receiver_deleted": False,
+            "deleted_at": None,
+            "admin_flagged": False
+        }
+        for i in range(messages)
+    ]
+    client.tables["admin_logs"] = [
+        {"id": i + 1, "admin_id": user_ids[0], "action": "ban_bot", "target_id": rng.choice(user_ids),
+         "details": {}, "created_at": ago(i)}
+        for i in range(200)
+    ]
+    client.tables["ban_history"] = [
+        {"id": i + 1, "user_id": rng.choice(user_ids), "ban_type": "bot", "reason": "ベンチマーク",
+         "banned_by": user_ids[0], "banned_at": ago(i)}
+        for i in range(200)
+    ]
+    client.tables["system_status"] = [{"id": 1, "is_safe_mode": False, "recovery_password_hash": "x"}]
+    for name in ("trade_holds", "storage", "login_attempts", "oauth_attempts", "dashboard_access"):
+        client.tables.setdefault(name, [])
+    return user_ids
+
+
+class FakeDiscordResponse:
+    def __init__(self, payload, status_code=200):
+        self.payload = payload
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.text = str(payload)
+        self.headers = {}
+
+    def json(self):
+        return self.payload
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+
+class FakeDiscord:
+    """routes.auth が使う requests モジュールの代わり (OAuth2 のトークン交換とユーザー取得)"""
+
+    def __init__(self, requests_module, user_id: str, latency_ms: float = 50.0):
+        self.exceptions = requests_module.exceptions
+        self.user_id = user_id
+        self.latency = latency_ms / 1000
+
+    def post(self, url, **kwargs):
+        time.sleep(self.latency)
+        return FakeDiscordResponse({"access_token": "fake-access-token", "token_type": "Bearer"})
+
+    def get(self, url, **kwargs):
+        time.sleep(self.latency)
+        return FakeDiscordResponse({"id": self.user_id, "username": "benchmark"})
@@ -0,0 +1,78 @@
+"""APIレスポンスのJSONエンコードのベンチマーク
+
+偽バックエンドのデータで大きめのペイロード (トレード履歴・プレイヤー一覧) を作り、
+以前の UTF8JSONResponse と同じ標準ライブラリ json の出力と、FastJSONResponse の出力を比較する。
+
+    python -m benchmarks.json_bench --repeat 50
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def build_payloads(trades: int) -> dict:
+    from benchmarks.fake_backend import FakeSupabase, seed_data
+
+    backend = FakeSupabase(latency_ms=0, jitter_ms=0)
+    seed_data(backend, trades=trades)
+    tables = backend.tables
+    return {
+        f"trade_history ({trades}件)": {"status": "success", "history": tables["trades"]},
+        f"players ({len(tables['players'])}件)": {"status": "success", "players": tables["players"]},
+        "notifications (1件)": {"status": "success", "unread_count": 3},
+    }
+
+
+def stdlib_render(content) -> bytes:
+    """比較用: 以前の UTF8JSONResponse.render と同じ処理"""
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def measure(render, content, repeat: int) -> tuple:
+    """1回あたりの時間 (ミリ秒) と出力サイズ"""
+    body = render(content)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        render(content)
+    return (time.perf_counter() - start) / repeat * 1000, len(body)
+
+
+def run(trades: int, repeat: int):
+    os.chdir(ROOT)
+    sys.path.insert(0, str(ROOT))
+    from utils import responses
+
+    backend_name = "orjson" if responses.orjson is not None else "json (orjsonなし)"
+    encoders = [
+        ("json.dumps", stdlib_render),
+        (f"FastJSONResponse [{backend_name}]", lambda content: responses.FastJSONResponse(content).body),
+    ]
+
+    print(f"{'payload':<26}{'encoder':<34}{'ms':>9}{'MB/s':>9}{'bytes':>12}")
+    for payload_name, content in build_payloads(trades).items():
+        # 出力が同じ内容であることを確認してから計測する
+        assert json.loads(stdlib_render(content)) == json.loads(responses.dumps(content))
+        baseline = None
+        for encoder_name, render in encoders:
+            ms, size = measure(render, content, repeat)
+            baseline = baseline or ms
+            throughput = size / (ms / 1000) / 1_000_000 if ms else float("inf")
+            speedup = f"  x{baseline / ms:.1f}" if ms and ms != baseline else ""
+            print(f"{payload_name:<26}{encoder_name:<34}{ms:>9.3f}{throughput:>9.1f}{size:>12,}{speedup}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSONエンコードのベンチマーク")
+    parser.add_argument("--trades", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    run(args.trades, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""エンドツーエンドの負荷テスト (レイテンシ予算との比較付き)
+
+インメモリの偽バックエンド (fake_backend) に差し替えたアプリに対して、
+主要な画面のシナリオを並列に実行し p50/p95/p99 とスループットを出力する。
+
+    python -m benchmarks.load_test                      # ASGIで直接呼び出す
+    python -m benchmarks.load_test --transport uvicorn  # uvicorn経由 (実ソケット)
+    python -m benchmarks.load_test --update-budgets     # 現在の結果を予算として保存
+
+予算 (benchmarks/budgets.json) を tolerance 以上超えたシナリオがあれば終了コード1で終わる。
+
+偽バックエンドの遅延は本番の supabase-py と同じくイベントループを塞ぐ。ルート内のDB呼び出しは
+直列に処理されるため、--concurrency を上げても DB 待ちは重ならず、p50/p95 は待ち行列の長さを含む
+(スレッドで実行している起動時・定期タスクの読み込みは計測対象外)。
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+BUDGETS_PATH = Path(__file__).resolve().parent / "budgets.json"
+
+ADMIN_ID = "100000000000000000"
+USER_ID = "100000000000000001"
+SECRET = "benchmark-secret"
+
+
+def setup_app(latency_ms: float, jitter_ms: float):
+    """偽バックエンドを組み込んだアプリを用意 (環境変数はアプリの import 前に設定する)"""
+    os.chdir(ROOT)
+    sys.path.insert(0, str(ROOT))
+    os.environ.update({
+        "SESSION_SECRET": SECRET,
+        "SUPABASE_URL": "http://fake-supabase.invalid",
+        "SUPABASE_KEY": "fake",
+        "ADMIN_DISCORD_ID": ADMIN_ID,
+        "DISCORD_CLIENT_ID": "fake-client",
+        "DISCORD_CLIENT_SECRET": "fake-secret",
+        "DISCORD_REDIRECT_URI": "http://localhost/auth/callback",
+    })
+
+    from benchmarks.fake_backend import FakeSupabase, FakeDiscord, seed_data
+    import supabase_client
+
+    backend = FakeSupabase(latency_ms=latency_ms, jitter_ms=jitter_ms)
+    seed_data(backend)
+    supabase_client._supabase_client = backend
+
+    import main
+    from routes import auth
+    auth.requests = FakeDiscord(auth.requests, USER_ID, latency_ms=latency_ms * 2)
+    return main, backend
+
+
+def make_token(discord_id: str) -> str:
+    from jose import jwt
+    return jwt.encode(
+        {"discord_id": discord_id, "exp": datetime.utcnow() + timedelta(hours=1)},
+        SECRET, algorithm="HS256"
+    )
+
+
+_ips = itertools.count(1)
+
+
+def client_headers(cookies: dict) -> dict:
+    """レート制限に掛からないようにリクエストごとに送信元IPを変える"""
+    n = next(_ips)
+    headers = {"X-Forwarded-For": f"10.{(n >> 16) & 255}.{(n >> 8) & 255}.{n & 255}"}
+    if cookies:
+        headers["Cookie"] = "; ".join(f"{key}={value}" for key, value in cookies.items())
+    return headers
+
+
+# ========================================
+# シナリオ (1回の実行で発行するリクエストの列)
+# ========================================
+
+def login_callback():
+    from jose import jwt
+    state = f"state-{next(_ips)}"
+    cookie = jwt.encode(
+        {"state": state, "exp": datetime.utcnow() + timedelta(minutes=10)}, SECRET, algorithm="HS256"
+    )
+    return [("GET", f"/auth/callback?code=fake&state={state}", {"oauth_state": cookie}, 302)]
+
+
+def dashboard():
+    cookies = {"session_token": make_token(USER_ID)}
+    return [("GET", "/dashboard", cookies, 200)]
+
+
+def trade_flow():
+    cookies = {"session_token": make_token(USER_ID)}
+    return [
+        ("GET", "/trade", cookies, 200),
+        ("GET", "/trade/history", cookies, 200),
+        ("GET", "/status", cookies, 200),
+    ]
+
+
+def trade_board():
+    cookies = {"session_token": make_token(USER_ID)}
+    return [
+        ("GET", "/trade-board", cookies, 200),
+        ("GET", "/trade-board?offering=回復薬", cookies, 200),
+        ("GET", "/trade-board/matches", cookies, 200),
+    ]
+
+
+def admin_dashboard():
+    cookies = {"session_token": make_token(ADMIN_ID), "admin_authenticated": "true"}
+    return [("GET", "/admin/dashboard", cookies, 200)]
+
+
+SCENARIOS = {
+    "login_callback": login_callback,
+    "dashboard": dashboard,
+    "trade_flow": trade_flow,
+    "trade_board": trade_board,
+    "admin_dashboard": admin_dashboard,
+}
+
+
+# ========================================
+# 実行と集計
+# ========================================
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+async def run_scenario(client, name, iterations, concurrency):
+    build = SCENARIOS[name]
+    latencies = []
+    errors = []
+    remaining = itertools.count()
+
+    async def worker():
+        while next(remaining) < iterations:
+            for method, path, cookies, expected in build():
+                start = time.perf_counter()
+                res = await client.request(method, path, headers=client_headers(cookies))
+                latencies.append((time.perf_counter() - start) * 1000)
+                if res.status_code != expected:
+                    errors.append(f"{method} {path} -> {res.status_code}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "error_samples": sorted(set(errors))[:3],
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(statistics.fmean(latencies), 2) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+    }
+
+
+def start_uvicorn(app, port):
+    import uvicorn
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+async def run(args):
+    import httpx
+
+    main, backend = setup_app(args.latency_ms, args.jitter_ms)
+    # 定期タスクは起動せず、起動時の読み込み (インデックス構築など) だけを行う
+    await main.startup_event()
+
+    if args.transport == "uvicorn":
+        server = start_uvicorn(main.app, args.port)
+        client = httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}")
+    else:
+        server = None
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench")
+
+    results = {}
+    try:
+        async with client:
+            for name in args.scenario or SCENARIOS:
+                # ウォームアップ (テンプレートのコンパイルなどを計測から外す)
+                await run_scenario(client, name, max(1, args.concurrency), args.concurrency)
+                calls_before = backend.calls
+                results[name] = await run_scenario(client, name, args.iterations, args.concurrency)
+                results[name]["backend_calls_per_request"] = round(
+                    (backend.calls - calls_before) / max(1, results[name]["requests"]), 2
+                )
+                main.rate_limit_storage.clear()
+    finally:
+        if server is not None:
+            server.should_exit = True
+    return results
+
+
+def compare(results, budgets, tolerance):
+    """予算との比較 (超過したシナリオの説明のリスト)"""
+    failures = []
+    for name, result in results.items():
+        budget = budgets.get("scenarios", {}).get(name)
+        if not budget:
+            continue
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            limit = budget.get(key)
+            if limit is not None and result[key] > limit * (1 + tolerance):
+                failures.append(f"{name}: {key} {result[key]}ms > 予算 {limit}ms (+{tolerance:.0%})")
+        if result["errors"]:
+            failures.append(f"{name}: エラー {result['errors']}件 {result['error_samples']}")
+    return failures
+
+
+def print_table(results, budgets):
+    print(f"{'scenario':<16}{'reqs':>6}{'err':>5}{'rps':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'db/req':>8}  budget p95/p99")
+    for name, r in results.items():
+        budget = budgets.get("scenarios", {}).get(name, {})
+        budget_text = f"{budget.get('p95_ms', '-')}/{budget.get('p99_ms', '-')}"
+        print(
+            f"{name:<16}{r['requests']:>6}{r['errors']:>5}{r['throughput_rps']:>8}"
+            f"{r['p50_ms']:>9}{r['p95_ms']:>9}{r['p99_ms']:>9}{r['backend_calls_per_request']:>8}  {budget_text}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RPG BOT Web の負荷テスト")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="実行するシナリオ (複数指定可)")
+    parser.add_argument("--iterations", type=int, default=100, help="シナリオごとの実行回数")
+    parser.add_argument("--concurrency", type=int, default=10, help="同時実行数")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="バックエンド1往復の遅延")
+    parser.add_argument("--jitter-ms", type=float, default=5.0, help="遅延のゆらぎ")
+    parser.add_argument("--transport", choices=["asgi", "uvicorn"], default="asgi")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--budgets", type=Path, default=BUDGETS_PATH)
+    parser.add_argument("--tolerance", type=float, default=0.25, help="予算超過の許容率")
+    parser.add_argument("--update-budgets", action="store_true", help="結果を予算として保存")
+    parser.add_argument("--json", type=Path, help="結果をJSONで保存")
+    args = parser.parse_args()
+
+    budgets = json.loads(args.budgets.read_text(encoding="utf-8")) if args.budgets.exists() else {}
+    results = asyncio.run(run(args))
+    print_table(results, budgets)
+
+    if args.json:
+        args.json.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    if args.update_budgets:
+        budgets = {
+            "settings": {
+                "iterations": args.iterations,
+                "concurrency": args.concurrency,
+                "latency_ms": args.latency_ms,
+                "jitter_ms": args.jitter_ms,
+                "transport": args.transport,
+                # ルート内のDB呼び出しはイベントループ上で直列化される (fake_backend.FakeSupabase.wait)
+                "backend_calls": "serialized",
+            },
+            "scenarios": {
+                name: {key: r[key] for key in ("p50_ms", "p95_ms", "p99_ms")}
+                for name, r in results.items()
+            },
+        }
+        args.budgets.write_text(json.dumps(budgets, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+        print(f"予算を更新しました: {args.budgets}")
+        return 0
+
+    failures = compare(results, budgets, args.tolerance)
+    for failure in failures:
+        print(f"❌ {failure}")
+    if not failures:
+        print("✅ すべてのシナリオが予算内です")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
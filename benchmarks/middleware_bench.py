@@ -0,0 +1,167 @@
+"""ミドルウェア1層あたりのオーバーヘッドを計測するマイクロベンチマーク
+
+空のエンドポイントにミドルウェアを1層ずつ重ね、リクエスト1件あたりの増分を出力する。
+比較用に、以前の BaseHTTPMiddleware 版のレート制限・JSONヘッダー処理も計測する。
+(JSONヘッダーの書き換えは FastJSONResponse が charset 付きで返すようになったため廃止済み)
+
+    python -m benchmarks.middleware_bench --requests 20000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def load_main():
+    os.chdir(ROOT)
+    sys.path.insert(0, str(ROOT))
+    os.environ.setdefault("SESSION_SECRET", "benchmark-secret")
+    import main
+    return main
+
+
+async def endpoint(scope, receive, send):
+    """何もしないJSONエンドポイント"""
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", b"2")]
+    })
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+def make_scope(path: str, n: int, method: str = "GET") -> dict:
+    # レート制限に掛からないように送信元IPを毎回変える
+    ip = f"10.{(n >> 16) & 255}.{(n >> 8) & 255}.{n & 255}".encode()
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [
+            (b"host", b"bench"),
+            (b"accept-encoding", b"gzip"),
+            (b"origin", b"http://example.com"),
+            (b"x-forwarded-for", ip),
+        ],
+        "client": ("127.0.0.1", 12345),
+        "server": ("bench", 80),
+    }
+
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def send(message):
+    pass
+
+
+async def measure(app, path: str, requests: int, method: str = "GET") -> float:
+    """1リクエストあたりの処理時間 (マイクロ秒)"""
+    for i in range(min(200, requests)):
+        await app(make_scope(path, i, method), receive, send)
+    start = time.perf_counter()
+    for i in range(requests):
+        await app(make_scope(path, i, method), receive, send)
+    return (time.perf_counter() - start) / requests * 1_000_000
+
+
+def legacy_middlewares(main):
+    """比較用: 以前の BaseHTTPMiddleware / @app.middleware("http") 実装"""
+    from starlette.middleware.base import BaseHTTPMiddleware
+
+    class LegacyRateLimit(BaseHTTPMiddleware):
+        async def dispatch(self, request, call_next):
+            client_ip = request.headers.get("X-Forwarded-For", "").split(",")[0].strip()
+            main.rate_limit_storage[client_ip].append(time.time())
+            return await call_next(request)
+
+    async def force_json_headers(request, call_next):
+        response = await call_next(request)
+        if response.headers.get("content-type", "").startswith("application/json"):
+            response.headers["Content-Type"] = "application/json; charset=utf-8"
+        return response
+
+    def legacy_json(app):
+        return BaseHTTPMiddleware(app, dispatch=force_json_headers)
+
+    return LegacyRateLimit, legacy_json
+
+
+async def run(requests: int):
+    main = load_main()
+    from starlette.middleware.cors import CORSMiddleware
+    from starlette.middleware.sessions import SessionMiddleware
+    from utils import metrics, tracing
+    from utils.circuit import StaleDataMiddleware
+    from utils.compression import CompressionMiddleware
+
+    secret = os.environ["SESSION_SECRET"]
+    # 内側から順に重ねる層 (main.py の登録順と同じ)
+    layers = [
+        ("RateLimitMiddleware", lambda app: main.RateLimitMiddleware(app)),
+        ("Session (対象外のパス)", lambda app: main.PathScopedMiddleware(
+            app, scoped_class=SessionMiddleware, paths=main.SESSION_PATHS, secret_key=secret)),
+        ("CompressionMiddleware", lambda app: CompressionMiddleware(app)),
+        ("CORSMiddleware", lambda app: CORSMiddleware(
+            app, allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"])),
+        ("QueryTraceMiddleware", lambda app: tracing.QueryTraceMiddleware(app)),
+        ("StaleDataMiddleware", lambda app: StaleDataMiddleware(app)),
+        ("MetricsMiddleware", lambda app: metrics.MetricsMiddleware(app)),
+        ("HealthProbeMiddleware", lambda app: main.HealthProbeMiddleware(app)),
+    ]
+
+    baseline = await measure(endpoint, "/bench", requests)
+    print(f"{'layer':<28}{'total µs':>10}{'+µs':>8}")
+    print(f"{'(endpoint only)':<28}{baseline:>10.2f}{'':>8}")
+
+    app = endpoint
+    previous = baseline
+    for name, wrap in layers:
+        app = wrap(app)
+        total = await measure(app, "/bench", requests)
+        print(f"{name:<28}{total:>10.2f}{total - previous:>+8.2f}")
+        previous = total
+        main.rate_limit_storage.clear()
+
+    print()
+    print("比較 (1層のみ)")
+    LegacyRateLimit, legacy_json = legacy_middlewares(main)
+    comparisons = [
+        ("RateLimit: BaseHTTPMiddleware", LegacyRateLimit(endpoint)),
+        ("RateLimit: ASGI", main.RateLimitMiddleware(endpoint)),
+        ("JSONヘッダー: @app.middleware", legacy_json(endpoint)),
+        ("Session: 全パス", SessionMiddleware(endpoint, secret_key=secret)),
+        ("Session: 対象パスのみ", main.PathScopedMiddleware(
+            endpoint, scoped_class=SessionMiddleware, paths=main.SESSION_PATHS, secret_key=secret)),
+    ]
+    for name, wrapped in comparisons:
+        total = await measure(wrapped, "/bench", requests)
+        print(f"{name:<32}{total - baseline:>+8.2f} µs")
+        main.rate_limit_storage.clear()
+
+    print()
+    print("ヘルスチェック (/health)")
+    full = await measure(main.app, "/health", requests)
+    print(f"{'アプリ全体 (ファストパス)':<32}{full:>8.2f} µs")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ミドルウェアのオーバーヘッド計測")
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""テンプレート描画のベンチマーク (admin_dashboard.html / trade.html)
+
+次の3通りで1回あたりの時間を比較する。
+  - 毎回新しい環境を作る (以前の429ページと同じ: 毎回コンパイル)
+  - 新しい環境 + バイトコードキャッシュ (プロセス起動直後の読み込み)
+  - 共有環境で事前コンパイル済み (現在の構成)
+
+    python -m benchmarks.render_bench --renders 200
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def build_contexts():
+    """偽バックエンドのデータから各ページの描画用コンテキストを作る"""
+    from benchmarks.fake_backend import FakeSupabase, seed_data
+    from utils.stats import AdminStats
+    import supabase_client
+
+    backend = FakeSupabase(latency_ms=0, jitter_ms=0)
+    user_ids = seed_data(backend)
+    tables = backend.tables
+    me = user_ids[1]
+
+    stats = AdminStats(supabase_client.OPEN_TRADE_STATUSES)
+    stats.reconcile(tables["players"], tables["trades"])
+
+    history = [t for t in tables["trades"] if me in (t["sender_id"], t["receiver_id"])]
+    counterparts = {
+        p["user_id"]: p for p in tables["players"]
+        if any(p["user_id"] in (t["sender_id"], t["receiver_id"]) for t in history)
+    }
+    player = next(p for p in tables["players"] if p["user_id"] == me)
+
+    return {
+        "admin_dashboard.html": {
+            "discord_id": user_ids[0],
+            "players": tables["players"],
+            "trades": [t for t in tables["trades"] if t["status"] == "pending"],
+            "admin_logs": tables["admin_logs"][:20],
+            "ban_history": tables["ban_history"][:20],
+            "stats": stats.snapshot(),
+        },
+        "trade.html": {
+            "discord_id": me,
+            "player": player,
+            "available_inventory": player["inventory"],
+            "held_items": [],
+            "my_trades": supabase_client.partition_my_trades(me, history),
+            "trade_history": history,
+            "counterparts": counterparts,
+        },
+    }
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="テンプレート描画のベンチマーク")
+    parser.add_argument("--renders", type=int, default=200)
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    sys.path.insert(0, str(ROOT))
+    os.environ.setdefault("SESSION_SECRET", "benchmark-secret")
+    os.environ["TEMPLATE_CACHE_DIR"] = tempfile.mkdtemp(prefix="render_bench_")
+
+    from utils import templates as shared
+
+    contexts = build_contexts()
+    shared.precompile_templates()
+    cold_repeat = max(1, args.renders // 10)
+
+    print(f"{'template':<24}{'毎回コンパイル':>14}{'bytecode読込':>14}{'共有・事前コンパイル':>20}   (ms/回)")
+    for name, context in contexts.items():
+        def cold():
+            # アプリと同じグローバル (stylesheets など) を持つ環境を、バイトコードキャッシュなしで作る
+            env = shared.create_environment()
+            env.bytecode_cache = None
+            env.get_template(name).render(context)
+
+        def from_bytecode():
+            shared.create_environment().get_template(name).render(context)
+
+        template = shared.templates.env.get_template(name)
+
+        def warm():
+            template.render(context)
+
+        print(
+            f"{name:<24}{timed(cold, cold_repeat):>14.2f}{timed(from_bytecode, cold_repeat):>14.2f}"
+            f"{timed(warm, args.renders):>20.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,42 +1,56 @@
-import json
-from typing import Any
 from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse
+from fastapi.exceptions import RequestValidationError
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import HTMLResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.middleware.gzip import GZipMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
 from starlette.middleware.sessions import SessionMiddleware
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException as StarletteHTTPException
 from datetime import datetime, timedelta
 from collections import defaultdict
-from starlette.middleware.base import BaseHTTPMiddleware
+import asyncio
 import os
 
-from routes import status, trade, auth, legal, admin, trade_board, dm
-
-class UTF8JSONResponse(JSONResponse):
-    media_type = "application/json; charset=utf-8"
-
-    def render(self, content: Any) -> bytes:
-        return json.dumps(
-            content,
-            ensure_ascii=False,
-            separators=(",", ":")
-        ).encode("utf-8")
+from utils import metrics, tracing
+from utils.circuit import StaleDataMiddleware
+from utils.compression import CompressionMiddleware
+from utils.responses import FastJSONResponse, set_etag_fingerprint
+from utils.templates import precompile_templates, render_cached_page, template_fingerprint
+from utils.assets import AssetStaticFiles, load_manifest
+from routes import status, trade, auth, legal, admin, trade_board, dm, notifications
 
 # グローバルレート制限 (メモリベース)
 rate_limit_storage = defaultdict(list)
 
-class RateLimitMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
+# レート制限の対象外 (ヘルスチェックと管理画面)
+RATE_LIMIT_EXEMPT_PATHS = ("/health", "/")
+
+class RateLimitMiddleware:
+    """IPアドレスごとのレート制限 (1分間に30リクエスト)
+
+    BaseHTTPMiddleware を使わない ASGI ミドルウェア (リクエストごとのタスク生成を避ける)
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
         # ヘルスチェックと管理画面はスキップ
-        if request.url.path in ["/health", "/"] or request.url.path.startswith("/admin"):
-            return await call_next(request)
+        path = scope["path"]
+        if path in RATE_LIMIT_EXEMPT_PATHS or path.startswith("/admin"):
+            await self.app(scope, receive, send)
+            return
 
         # IPアドレス取得
-        client_ip = request.headers.get("X-Forwarded-For", "").split(",")[0].strip()
+        headers = Headers(scope=scope)
+        client_ip = headers.get("x-forwarded-for", "").split(",")[0].strip()
         if not client_ip:
-            client_ip = request.headers.get("X-Real-IP", request.client.host if request.client else "unknown")
+            client = scope.get("client")
+            client_ip = headers.get("x-real-ip", client[0] if client else "unknown")
 
         current_time = datetime.utcnow()
 
@@ -49,35 +63,91 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
 
         # レート制限チェック (1分間に30リクエスト)
         if len(rate_limit_storage[client_ip]) >= 30:
-            from fastapi.templating import Jinja2Templates
-            templates = Jinja2Templates(directory="templates")
-            return templates.TemplateResponse(
-                "rate_limit.html",
-                {"request": request},
-                status_code=429
-            )
+            metrics.rate_limited.inc()
+            response = render_cached_page(Request(scope), "rate_limit.html", status_code=429)
+            await response(scope, receive, send)
+            return
 
         # リクエスト記録
         rate_limit_storage[client_ip].append(current_time)
 
-        return await call_next(request)
+        await self.app(scope, receive, send)
+
+class PathScopedMiddleware:
+    """指定したパス (とその配下) にだけ別のミドルウェアを適用"""
+
+    def __init__(self, app, scoped_class, paths, **options):
+        self.app = app
+        self.scoped = scoped_class(app, **options)
+        self.paths = tuple(paths)
+        self.prefixes = tuple(path.rstrip("/") + "/" for path in self.paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] in ("http", "websocket"):
+            path = scope["path"]
+            if path in self.paths or path.startswith(self.prefixes):
+                await self.scoped(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+# ミドルウェアを通さずに応答するヘルスチェック (UptimeRobot・Render の監視)
+HEALTH_PROBES = {("GET", "/health"), ("HEAD", "/health"), ("HEAD", "/")}
+
+class HealthProbeMiddleware:
+    """ヘルスチェックをミドルウェアスタックの手前で応答する"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and (scope["method"], scope["path"]) in HEALTH_PROBES:
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/plain; charset=utf-8"),
+                    (b"content-length", b"2")
+                ]
+            })
+            await send({
+                "type": "http.response.body",
+                "body": b"" if scope["method"] == "HEAD" else b"OK"
+            })
+            return
+        await self.app(scope, receive, send)
 
 # FastAPIアプリ作成
 app = FastAPI(
     title="RPG BOT Web",
     version="1.0.0",
-    default_response_class=UTF8JSONResponse
+    default_response_class=FastJSONResponse
 )
 
-templates = Jinja2Templates(directory="templates")
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.mount("/static", AssetStaticFiles(directory="static"), name="static")
+
+# エラー時のJSONも共通のレスポンスクラスで返す (charset 付き)
+@app.exception_handler(StarletteHTTPException)
+async def http_exception_handler(request: Request, exc: StarletteHTTPException):
+    return FastJSONResponse(
+        {"detail": exc.detail},
+        status_code=exc.status_code,
+        headers=getattr(exc, "headers", None)
+    )
+
+@app.exception_handler(RequestValidationError)
+async def validation_exception_handler(request: Request, exc: RequestValidationError):
+    return FastJSONResponse({"detail": jsonable_encoder(exc.errors())}, status_code=422)
 
 # アプリにレート制限ミドルウェアを追加
 app.add_middleware(RateLimitMiddleware)
 
-# SessionMiddleware を追加
+# request.session を読むページ (規約・プライバシー) だけに SessionMiddleware を適用
+SESSION_PATHS = ("/terms", "/bot-terms", "/privacy")
+
 app.add_middleware(
-    SessionMiddleware,
+    PathScopedMiddleware,
+    scoped_class=SessionMiddleware,
+    paths=SESSION_PATHS,
     secret_key=os.getenv("SESSION_SECRET", "your-secret-key-here-change-in-production")
 )
 
@@ -92,6 +162,7 @@ async def health_check():
     ヘルスチェックエンドポイント
     UptimeRobotやRenderの監視に使用
     HEADとGETリクエストの両方に対応
+    (実際の応答は HealthProbeMiddleware が先に返す。ルートはAPIドキュメント用に残している)
     """
     return "OK"
 
@@ -103,6 +174,24 @@ async def root_head():
     """
     return PlainTextResponse("OK", status_code=200)
 
+# ========================================
+# メトリクス (Prometheus形式)
+# ========================================
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics_endpoint(request: Request):
+    """
+    Prometheus形式のメトリクス
+    METRICS_TOKEN 設定時は Authorization: Bearer <token> が必要
+    """
+    token = os.getenv("METRICS_TOKEN")
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        return PlainTextResponse("Unauthorized", status_code=401)
+    return PlainTextResponse(
+        metrics.registry.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
 # ========================================
 # トップページ
 # ========================================
@@ -110,9 +199,7 @@ async def root_head():
 @app.get("/", response_class=HTMLResponse)
 async def root(request: Request):
     """トップページ"""
-    return templates.TemplateResponse("index.html", {
-        "request": request
-    })
+    return render_cached_page(request, "index.html")
 
 # ルーター登録
 app.include_router(auth.router, prefix="/auth", tags=["auth"])
@@ -121,9 +208,11 @@ app.include_router(trade.router, tags=["trade"])
 app.include_router(legal.router, tags=["legal"])
 app.include_router(trade_board.router, tags=["trade_board"])
 app.include_router(dm.router, tags=["dm"])
+app.include_router(notifications.router, tags=["notifications"])
 app.include_router(admin.router, tags=["admin"])
 
-app.add_middleware(GZipMiddleware)
+# brotli/gzip 圧縮 (小さいレスポンス・圧縮済みファイル・SSE は対象外)
+app.add_middleware(CompressionMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -132,14 +221,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-@app.middleware("http")
-async def force_json_headers(request, call_next):
-    response = await call_next(request)
-    if response.headers.get("content-type", "").startswith("application/json"):
-        response.headers["Content-Type"] = "application/json; charset=utf-8"
-        if "content-disposition" in response.headers:
-            del response.headers["content-disposition"]
-    return response
+# DB_TRACE 有効時のみリクエストごとの問い合わせを記録
+app.add_middleware(tracing.QueryTraceMiddleware)
+
+# DB障害中にキャッシュの古いデータで応答した場合は X-Data-Stale ヘッダーを付ける
+app.add_middleware(StaleDataMiddleware)
+
+# 最後に追加したミドルウェアが最も外側になる (429や圧縮後のレスポンスも含めて計測)
+app.add_middleware(metrics.MetricsMiddleware)
+
+# ヘルスチェックはメトリクスも含めてすべてのミドルウェアより手前で応答する
+app.add_middleware(HealthProbeMiddleware)
 
 # スタートアップイベント（Supabase接続時のみ有効）
 @app.on_event("startup")
@@ -150,6 +242,15 @@ async def startup_event():
     print("📍 ヘルスチェックエンドポイント: /health")
     print("📍 ルートパス: /")
     print("=" * 50)
+
+    # CSSバンドルを確認 (未ビルド・ソース変更時はここでビルドする)
+    if load_manifest().get("files"):
+        print("✅ 静的アセットのバンドル確認完了")
+
+    # テンプレートを事前にコンパイル (初回アクセス時のコンパイル待ちをなくす)
+    print(f"✅ テンプレートのコンパイル完了: {precompile_templates()}件")
+    # 条件付きGETの ETag にテンプレート・アセットの指紋を混ぜる (デプロイ後に古い表示を返さない)
+    set_etag_fingerprint(template_fingerprint())
     
     # 環境変数チェック
     required_env = ["SUPABASE_URL", "SUPABASE_KEY", "SESSION_SECRET"]
@@ -164,30 +265,75 @@ async def startup_event():
         try:
             import supabase_client
             if supabase_client.get_supabase_client() is not None:
-                supabase_client.cleanup_expired_holds()
-                supabase_client.cleanup_expired_trade_posts()
+                with tracing.traced("startup cleanup"):
+                    supabase_client.cleanup_expired_holds()
+                    supabase_client.cleanup_expired_trade_posts()
                 print("✅ 期限切れデータのクリーンアップ完了")
+                if await asyncio.to_thread(supabase_client.load_trade_post_index):
+                    print("✅ トレード掲示板インデックス構築完了")
+                if await asyncio.to_thread(supabase_client.load_dm_search_index):
+                    print("✅ DM検索インデックス構築完了")
+                if await asyncio.to_thread(supabase_client.reconcile_admin_stats):
+                    print("✅ 管理画面の集計完了")
+                if await asyncio.to_thread(supabase_client.load_ban_registry):
+                    print(f"✅ BAN中ユーザーの読み込み完了: Web {supabase_client.ban_registry.count('web')}件")
         except Exception as e:
             print(f"⚠️  Supabaseクリーンアップエラー: {e}")
     
     print("=" * 50)
 
 # 定期的にクリーンアップ(オプション)
-import asyncio
+# (supabase-py は同期クライアントなので、DBを読む処理はスレッドで実行してイベントループを塞がない)
 
 async def periodic_cleanup():
     while True:
         await asyncio.sleep(3600)  # 1時間ごと
         try:
             import supabase_client
-            supabase_client.cleanup_expired_holds()
-            supabase_client.cleanup_expired_trade_posts()
+            with tracing.traced("cleanup_expired_holds"):
+                await asyncio.to_thread(supabase_client.cleanup_expired_holds)
         except Exception as e:
             print(f"定期クリーンアップエラー: {e}")
 
+async def periodic_trade_post_purge():
+    """期限切れ投稿を少しずつ削除 (表示は読み取り側で期限判定済み)"""
+    while True:
+        await asyncio.sleep(60)  # 1分ごと
+        try:
+            import supabase_client
+            if supabase_client.get_supabase_client() is not None:
+                await asyncio.to_thread(supabase_client.cleanup_expired_trade_posts, max_chunks=5)
+        except Exception as e:
+            print(f"期限切れ投稿の削除エラー: {e}")
+
+async def periodic_stats_reconcile():
+    """差分更新している集計値をDBと突き合わせる"""
+    while True:
+        await asyncio.sleep(600)  # 10分ごと
+        try:
+            import supabase_client
+            if supabase_client.get_supabase_client() is not None:
+                await asyncio.to_thread(supabase_client.reconcile_admin_stats)
+        except Exception as e:
+            print(f"集計の突き合わせエラー: {e}")
+
+async def periodic_ban_refresh():
+    """BOT側・他インスタンスでのBAN/解除を ban_history の差分から取り込む"""
+    while True:
+        await asyncio.sleep(30)  # 30秒ごと
+        try:
+            import supabase_client
+            if supabase_client.get_supabase_client() is not None:
+                await asyncio.to_thread(supabase_client.refresh_ban_registry)
+        except Exception as e:
+            print(f"BAN情報の更新エラー: {e}")
+
 @app.on_event("startup")
 async def start_periodic_tasks():
     try:
         asyncio.create_task(periodic_cleanup())
+        asyncio.create_task(periodic_trade_post_purge())
+        asyncio.create_task(periodic_stats_reconcile())
+        asyncio.create_task(periodic_ban_refresh())
     except Exception as e:
         print(f"定期タスク起動エラー: {e}")
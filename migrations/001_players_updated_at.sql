@@ -0,0 +1,13 @@
+-- players.updated_at (条件付きGETの行バージョン)
+-- Web側は supabase_client.versioned() で明示的に設定し、BOT側の更新はトリガーで進める。
+-- Supabase の SQL Editor で一度だけ実行する (再実行しても問題ない)。
+
+create extension if not exists moddatetime schema extensions;
+
+alter table public.players
+    add column if not exists updated_at timestamptz not null default now();
+
+drop trigger if exists players_touch on public.players;
+create trigger players_touch
+    before update on public.players
+    for each row execute function extensions.moddatetime(updated_at);
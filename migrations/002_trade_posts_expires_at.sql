@@ -0,0 +1,11 @@
+-- trade_posts.expires_at (投稿の有効期限)
+-- create_trade_post が created_at + 7日 を書き込む。既存の投稿は NULL のまま残り、
+-- 読み取り・削除側で created_at + 7日 として扱う (supabase_client._trade_post_expiry_filter)。
+-- Supabase の SQL Editor で一度だけ実行する (再実行しても問題ない)。
+
+alter table public.trade_posts
+    add column if not exists expires_at timestamptz;
+
+-- 有効な投稿の取得と期限切れ投稿の削除 (expires_at での範囲検索) 用
+create index if not exists trade_posts_expires_at_idx
+    on public.trade_posts (expires_at);
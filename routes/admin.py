@@ -1,12 +1,21 @@
 from fastapi import APIRouter, Request, Form, HTTPException, Cookie
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
-from fastapi.templating import Jinja2Templates
-from jose import jwt, JWTError
+from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse
+from utils.responses import FastJSONResponse, dumps
 from passlib.hash import argon2
 import os
+import re
+import csv
+import io
+import json
+import asyncio
 import httpx
-from datetime import datetime
+from datetime import datetime, timedelta
 import supabase_client
+from utils.events import notifications, format_sse
+from utils.search_index import normalize_text
+from utils.templates import templates
+from utils.auth import session_discord_id
+from utils.bans import ban_registry
 from utils.security import (
     check_account_lock,
     check_safe_mode_trigger,
@@ -17,27 +26,16 @@ from utils.security import (
 )
 
 router = APIRouter()
-templates = Jinja2Templates(directory="templates")
 
 # 環境変数から取得
 ADMIN_DISCORD_ID = os.getenv("ADMIN_DISCORD_ID")
 ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD")
 RECOVERY_PASSWORD = os.getenv("RECOVERY_PASSWORD")
 DISCORD_WEBHOOK_URL = os.getenv("DISCORD_WEBHOOK_URL")
-SECRET_KEY = os.getenv("SESSION_SECRET")
-ALGORITHM = "HS256"
 
 def get_discord_id_from_token(session_token: str = None) -> str:
-    """JWTトークンからDiscord IDを取得"""
-    if not session_token:
-        return None
-    try:
-        payload = jwt.decode(session_token, SECRET_KEY, algorithms=[ALGORITHM])
-        discord_id = payload.get("discord_id")
-        return str(discord_id) if discord_id else None
-    except JWTError as e:
-        print(f"DEBUG: JWTデコードエラー - {e}")
-        return None
+    """JWTトークンからDiscord IDを取得 (検証済みトークンはキャッシュから返す)"""
+    return session_discord_id(session_token)
 
 def is_admin(discord_id: str, request: Request) -> bool:
     """管理者かどうか確認"""
@@ -265,21 +263,48 @@ async def recovery_unlock(request: Request, recovery_password: str = Form(...),
         await send_discord_alert(f"⚠️ 復旧処理エラー\nエラー: {str(e)}\n時刻: {datetime.utcnow().isoformat()}")
         raise HTTPException(status_code=500, detail="復旧処理に失敗しました")
 
+# 実行中のバックグラウンド集計 (重複して走らせない)
+_stats_reconcile_task = None
+
+def start_stats_reconcile():
+    """集計の突き合わせをスレッドで開始 (リクエストは完了を待たない)"""
+    global _stats_reconcile_task
+    if _stats_reconcile_task is None or _stats_reconcile_task.done():
+        _stats_reconcile_task = asyncio.create_task(asyncio.to_thread(supabase_client.reconcile_admin_stats))
+
+# ダッシュボードの一覧1ページあたりの件数 (件数は集計値から表示する)
+DASHBOARD_PAGE_SIZE = 50
+
 @router.get("/admin/dashboard", response_class=HTMLResponse)
-async def admin_dashboard(request: Request, session_token: str = Cookie(None)):
-    """管理者ダッシュボード"""
+async def admin_dashboard(
+    request: Request,
+    players_after: str = None,
+    trades_before: int = None,
+    session_token: str = Cookie(None)
+):
+    """管理者ダッシュボード (プレイヤー・進行中トレードはキーセットでページ送り)"""
     discord_id = get_discord_id_from_token(session_token)
 
     if not is_admin(discord_id, request):
         return RedirectResponse(url="/admin", status_code=302)
 
-    # 全プレイヤーデータ取得
-    players_data = supabase_client.supabase.table("players").select("*").execute()
+    # プレイヤー一覧 (Discord ID順。次ページの有無を知るため1件多く取得)
+    players_query = supabase_client.supabase.table("players").select("*")
+    if players_after:
+        players_query = players_query.gt("user_id", players_after)
+    players_data = players_query.order("user_id").limit(DASHBOARD_PAGE_SIZE + 1).execute()
     players = players_data.data if players_data.data else []
-
-    # 進行中のトレード取得
-    trades_data = supabase_client.supabase.table("trades").select("*").eq("status", "pending").execute()
+    next_players_after = players[DASHBOARD_PAGE_SIZE - 1]["user_id"] if len(players) > DASHBOARD_PAGE_SIZE else None
+    players = players[:DASHBOARD_PAGE_SIZE]
+
+    # 進行中のトレード (新しい順)
+    trades_query = supabase_client.supabase.table("trades").select("*").in_("status", list(supabase_client.OPEN_TRADE_STATUSES))
+    if trades_before is not None:
+        trades_query = trades_query.lt("id", trades_before)
+    trades_data = trades_query.order("id", desc=True).limit(DASHBOARD_PAGE_SIZE + 1).execute()
     trades = trades_data.data if trades_data.data else []
+    next_trades_before = trades[DASHBOARD_PAGE_SIZE - 1]["id"] if len(trades) > DASHBOARD_PAGE_SIZE else None
+    trades = trades[:DASHBOARD_PAGE_SIZE]
 
     # 管理者ログ取得 (最新20件)
     admin_logs_data = supabase_client.supabase.table("admin_logs").select("*").order("created_at", desc=True).limit(20).execute()
@@ -289,13 +314,23 @@ async def admin_dashboard(request: Request, session_token: str = Cookie(None)):
     ban_history_data = supabase_client.supabase.table("ban_history").select("*").order("banned_at", desc=True).limit(20).execute()
     ban_history = ban_history_data.data if ban_history_data.data else []
 
+    # 集計値 (差分更新済みの値をそのまま表示する。未集計ならバックグラウンドで集計し「準備中」を表示)
+    if not supabase_client.admin_stats.loaded:
+        start_stats_reconcile()
+    stats = supabase_client.admin_stats.snapshot()
+
     return templates.TemplateResponse("admin_dashboard.html", {
         "request": request,
         "discord_id": discord_id,
         "players": players,
         "trades": trades,
+        "next_players_after": next_players_after,
+        "next_trades_before": next_trades_before,
+        "is_first_players_page": not players_after,
+        "is_first_trades_page": trades_before is None,
         "admin_logs": admin_logs,
-        "ban_history": ban_history
+        "ban_history": ban_history,
+        "stats": stats
     })
 
 @router.post("/admin/ban-bot/{discord_id}")
@@ -308,9 +343,12 @@ async def ban_bot_user(request: Request, discord_id: str, reason: str = Form(...
     client_ip = get_client_ip(request)
 
     # BANを実行
-    supabase_client.supabase.table("players").update({
+    supabase_client.supabase.table("players").update(supabase_client.versioned({
         "bot_banned": True
-    }).eq("user_id", discord_id).execute()
+    })).eq("user_id", discord_id).execute()
+    supabase_client.invalidate_player_cache(discord_id)
+    supabase_client.admin_stats.update_player(discord_id, {"bot_banned": True})
+    ban_registry.set(discord_id, "bot", True)
 
     # BAN履歴を記録
     supabase_client.supabase.table("ban_history").insert({
@@ -332,7 +370,7 @@ async def ban_bot_user(request: Request, discord_id: str, reason: str = Form(...
         "created_at": datetime.utcnow().isoformat()
     }).execute()
 
-    return JSONResponse({"message": f"Discord ID {discord_id} をBOT利用禁止にしました"})
+    return FastJSONResponse({"message": f"Discord ID {discord_id} をBOT利用禁止にしました"})
 
 # 同様に unban_bot, ban_web, unban_web も修正...
 # (次のメッセージで提示します)
@@ -356,9 +394,12 @@ async def unban_bot_user(request: Request, discord_id: str, session_token: str =
     client_ip = get_client_ip(request)
 
     # BAN解除
-    supabase_client.supabase.table("players").update({
+    supabase_client.supabase.table("players").update(supabase_client.versioned({
         "bot_banned": False
-    }).eq("user_id", discord_id).execute()
+    })).eq("user_id", discord_id).execute()
+    supabase_client.invalidate_player_cache(discord_id)
+    supabase_client.admin_stats.update_player(discord_id, {"bot_banned": False})
+    ban_registry.set(discord_id, "bot", False)
 
     # BAN履歴を更新 (is_active = False, unbanned_at設定)
     supabase_client.supabase.table("ban_history").update({
@@ -376,7 +417,7 @@ async def unban_bot_user(request: Request, discord_id: str, session_token: str =
         "created_at": datetime.utcnow().isoformat()
     }).execute()
 
-    return JSONResponse({"message": f"Discord ID {discord_id} のBOT利用禁止を解除しました"})
+    return FastJSONResponse({"message": f"Discord ID {discord_id} のBOT利用禁止を解除しました"})
 
 @router.post("/admin/ban-web/{discord_id}")
 async def ban_web_user(request: Request, discord_id: str, reason: str = Form(...), session_token: str = Cookie(None)):
@@ -388,9 +429,12 @@ async def ban_web_user(request: Request, discord_id: str, reason: str = Form(...
     client_ip = get_client_ip(request)
 
     # BANを実行
-    supabase_client.supabase.table("players").update({
+    supabase_client.supabase.table("players").update(supabase_client.versioned({
         "web_banned": True
-    }).eq("user_id", discord_id).execute()
+    })).eq("user_id", discord_id).execute()
+    supabase_client.invalidate_player_cache(discord_id)
+    supabase_client.admin_stats.update_player(discord_id, {"web_banned": True})
+    ban_registry.set(discord_id, "web", True)
 
     # BAN履歴を記録
     supabase_client.supabase.table("ban_history").insert({
@@ -412,7 +456,7 @@ async def ban_web_user(request: Request, discord_id: str, reason: str = Form(...
         "created_at": datetime.utcnow().isoformat()
     }).execute()
 
-    return JSONResponse({"message": f"Discord ID {discord_id} をWeb利用禁止にしました"})
+    return FastJSONResponse({"message": f"Discord ID {discord_id} をWeb利用禁止にしました"})
 
 @router.post("/admin/unban-web/{discord_id}")
 async def unban_web_user(request: Request, discord_id: str, session_token: str = Cookie(None)):
@@ -424,9 +468,12 @@ async def unban_web_user(request: Request, discord_id: str, session_token: str =
     client_ip = get_client_ip(request)
 
     # BAN解除
-    supabase_client.supabase.table("players").update({
+    supabase_client.supabase.table("players").update(supabase_client.versioned({
         "web_banned": False
-    }).eq("user_id", discord_id).execute()
+    })).eq("user_id", discord_id).execute()
+    supabase_client.invalidate_player_cache(discord_id)
+    supabase_client.admin_stats.update_player(discord_id, {"web_banned": False})
+    ban_registry.set(discord_id, "web", False)
 
     # BAN履歴を更新
     supabase_client.supabase.table("ban_history").update({
@@ -444,7 +491,7 @@ async def unban_web_user(request: Request, discord_id: str, session_token: str =
         "created_at": datetime.utcnow().isoformat()
     }).execute()
 
-    return JSONResponse({"message": f"Discord ID {discord_id} のWeb利用禁止を解除しました"})
+    return FastJSONResponse({"message": f"Discord ID {discord_id} のWeb利用禁止を解除しました"})
 
 @router.post("/admin/cancel-trade/{trade_id}")
 async def cancel_trade(request: Request, trade_id: int, session_token: str = Cookie(None)):
@@ -453,33 +500,500 @@ async def cancel_trade(request: Request, trade_id: int, session_token: str = Coo
     if not is_admin(admin_id, request):
         raise HTTPException(status_code=403, detail="管理者権限がありません")
 
+    # 一括キャンセルと同じ処理 (進行中のものだけを対象にし、当事者に通知する)
+    results, error = cancel_open_trades(admin_id, get_client_ip(request), [trade_id], "管理者による強制キャンセル")
+    if error:
+        raise HTTPException(status_code=500, detail=f"強制キャンセルに失敗しました: {error}")
+    if results[trade_id] != "ok":
+        raise HTTPException(status_code=404, detail="進行中のトレードが見つかりません")
+
+    return FastJSONResponse({"message": f"トレード ID {trade_id} を強制キャンセルしました"})
+
+def dm_monitor_filter(user_id: str = None, keyword: str = None):
+    """監視フィードの絞り込み条件 (配信前にサーバー側で判定する)"""
+    user_id = (user_id or "").strip()
+    keyword = normalize_text(keyword).strip()
+
+    def matches(msg: dict) -> bool:
+        if user_id and user_id not in (str(msg.get("sender_id")), str(msg.get("receiver_id"))):
+            return False
+        if keyword and keyword not in normalize_text(msg.get("message")):
+            return False
+        return True
+
+    return matches
+
+@router.get("/admin/dm-monitor", response_class=HTMLResponse)
+async def dm_monitor(request: Request, user: str = "", keyword: str = "", session_token: str = Cookie(None)):
+    """DM監視 (最新100件 + 新着のライブ配信)"""
+    admin_id = get_discord_id_from_token(session_token)
+    if not is_admin(admin_id, request):
+        return RedirectResponse(url="/admin", status_code=302)
+
+    user = user.strip()
+    keyword = keyword.strip()
+    messages = supabase_client.get_recent_messages(
+        limit=100,
+        user_id=user or None,
+        keyword=keyword or None
+    )
+
+    return templates.TemplateResponse("admin_dm_monitor.html", {
+        "request": request,
+        "discord_id": admin_id,
+        "messages": messages,
+        "cursor": messages[0]["id"] if messages else 0,
+        "filters": {"user": user, "keyword": keyword}
+    })
+
+@router.get("/admin/dm-monitor/stream")
+async def dm_monitor_stream(
+    request: Request,
+    since: int = 0,
+    user: str = "",
+    keyword: str = "",
+    session_token: str = Cookie(None)
+):
+    """DM監視の新着フィード (SSE, cursor より後のメッセージのみ)"""
+    admin_id = get_discord_id_from_token(session_token)
+    if not is_admin(admin_id, request):
+        raise HTTPException(status_code=403, detail="管理者権限がありません")
+
+    # 再接続時はブラウザが送る Last-Event-ID を優先する
+    last_event_id = request.headers.get("Last-Event-ID")
+    if last_event_id and last_event_id.isdigit():
+        since = int(last_event_id)
+
+    matches = dm_monitor_filter(user, keyword)
+    subscription = notifications.subscribe(supabase_client.DM_MONITOR_TOPIC, filter_fn=matches)
+    if subscription is None:
+        raise HTTPException(status_code=503, detail="接続数が上限に達しています")
+
+    async def stream():
+        cursor = since
+        try:
+            yield "retry: 5000\n\n"
+            # 切断中に届いたメッセージを先に送る (購読開始後なので取りこぼしはない)
+            missed = supabase_client.get_messages_after(
+                cursor,
+                user_id=user.strip() or None,
+                keyword=keyword.strip() or None,
+                filter_fn=matches
+            )
+            for msg in missed:
+                yield format_sse("dm", msg, msg["id"])
+                cursor = max(cursor, msg["id"])
+
+            while not await request.is_disconnected():
+                item = await subscription.get(timeout=15)
+                if item is None:
+                    yield ": keepalive\n\n"
+                    continue
+                event, msg = item
+                if msg["id"] <= cursor:
+                    continue
+                cursor = msg["id"]
+                yield format_sse(event, msg, msg["id"])
+        finally:
+            notifications.unsubscribe(subscription)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+@router.get("/admin/dm-search", response_class=HTMLResponse)
+async def dm_search(
+    request: Request,
+    keyword: str = "",
+    sender_id: str = "",
+    receiver_id: str = "",
+    date_from: str = "",
+    date_to: str = "",
+    before: int = None,
+    session_token: str = Cookie(None)
+):
+    """DM検索 (本文のバイグラム検索 + 送信者/受信者/日付の絞り込み)"""
+    admin_id = get_discord_id_from_token(session_token)
+    if not is_admin(admin_id, request):
+        return RedirectResponse(url="/admin", status_code=302)
+
+    keyword = keyword.strip()
+    result = {"messages": [], "total": 0, "next_cursor": None}
+    if keyword:
+        result = supabase_client.search_direct_messages(
+            keyword,
+            sender_id=sender_id.strip() or None,
+            receiver_id=receiver_id.strip() or None,
+            date_from=date_from or None,
+            date_to=date_to or None,
+            before_id=before,
+            limit=50
+        )
+
+    return templates.TemplateResponse("admin_dm_search.html", {
+        "request": request,
+        "discord_id": admin_id,
+        "keyword": keyword,
+        "filters": {
+            "keyword": keyword,
+            "sender_id": sender_id,
+            "receiver_id": receiver_id,
+            "date_from": date_from,
+            "date_to": date_to
+        },
+        "messages": result["messages"],
+        "total": result["total"],
+        "next_cursor": result["next_cursor"],
+        "is_first_page": before is None
+    })
+
+# ========================================
+# 一括操作
+# ========================================
+
+# 1リクエストで処理できる対象数
+BULK_MAX_TARGETS = 1000
+# in_() フィルタ1回あたりのID数 (URL長の上限対策)
+BULK_CHUNK_SIZE = 100
+
+BAN_LABELS = {"bot": "BOT", "web": "Web"}
+
+def parse_bulk_ids(values) -> list:
+    """一括操作の対象ID (改行・カンマ・空白区切りも可) を重複なしのリストに変換"""
+    ids = []
+    for value in values:
+        ids.extend(target for target in re.split(r"[\s,]+", str(value)) if target)
+    return list(dict.fromkeys(ids))
+
+def chunked(items: list, size: int = BULK_CHUNK_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def bulk_set_ban(admin_id: str, client_ip: str, user_ids: list, ban_type: str, banned: bool, reason: str):
+    """BAN/解除をチャンクごとにまとめて実行し、(IDごとの結果, エラー) を返す
+
+    チャンク単位で プレイヤー更新 → キャッシュ・集計・BAN情報 → BAN履歴・管理者ログ の順に反映する。
+    途中で失敗した場合はそこで打ち切り、未処理のIDは "error" として返す。
+    """
+    now = datetime.utcnow().isoformat()
+    column = f"{ban_type}_banned"
+    results = {user_id: "error" for user_id in user_ids}
+
+    for chunk in chunked(user_ids):
+        try:
+            # プレイヤー更新 (更新された行 = 存在するプレイヤー)
+            res = supabase_client.supabase.table("players").update(supabase_client.versioned({
+                column: banned
+            })).in_("user_id", chunk).execute()
+        except Exception as e:
+            print(f"Error in bulk ban (players): {e}")
+            return results, str(e)
+
+        updated = {str(player["user_id"]) for player in res.data or []}
+        for user_id in chunk:
+            supabase_client.invalidate_player_cache(user_id)
+            if user_id in updated:
+                supabase_client.admin_stats.update_player(user_id, {column: banned})
+                ban_registry.set(user_id, ban_type, banned)
+            results[user_id] = "ok" if user_id in updated else "not_found"
+
+        targets = [user_id for user_id in chunk if user_id in updated]
+        if not targets:
+            continue
+        try:
+            # BAN履歴
+            if banned:
+                supabase_client.supabase.table("ban_history").insert([{
+                    "user_id": user_id,
+                    "ban_type": ban_type,
+                    "reason": reason,
+                    "banned_by": admin_id,
+                    "banned_at": now,
+                    "is_active": True
+                } for user_id in targets]).execute()
+            else:
+                supabase_client.supabase.table("ban_history").update({
+                    "is_active": False,
+                    "unbanned_at": now
+                }).in_("user_id", targets).eq("ban_type", ban_type).eq("is_active", True).execute()
+
+            # 管理者ログ
+            supabase_client.supabase.table("admin_logs").insert([{
+                "admin_id": admin_id,
+                "action": f"{'ban' if banned else 'unban'}_{ban_type}",
+                "target_id": user_id,
+                "reason": reason,
+                "ip_address": client_ip,
+                "created_at": now
+            } for user_id in targets]).execute()
+        except Exception as e:
+            # プレイヤーの更新は反映済み (履歴・ログだけが欠ける)
+            print(f"Error in bulk ban (history): {e}")
+            for user_id in targets:
+                results[user_id] = "unlogged"
+            return results, str(e)
+
+    return results, None
+
+async def bulk_ban_response(request: Request, session_token: str, ids: list, ban_type: str, banned: bool, reason: str):
+    """一括BAN/解除エンドポイント共通処理"""
+    admin_id = get_discord_id_from_token(session_token)
+    if not is_admin(admin_id, request):
+        raise HTTPException(status_code=403, detail="管理者権限がありません")
+
+    user_ids = parse_bulk_ids(ids)
+    if not user_ids:
+        return FastJSONResponse({"error": "対象のDiscord IDを入力してください"}, status_code=400)
+    if len(user_ids) > BULK_MAX_TARGETS:
+        return FastJSONResponse({"error": f"一度に処理できるのは{BULK_MAX_TARGETS}件までです"}, status_code=400)
+
+    results, error = bulk_set_ban(admin_id, get_client_ip(request), user_ids, ban_type, banned, reason)
+
+    succeeded = sum(1 for result in results.values() if result in ("ok", "unlogged"))
+    action = "利用禁止に" if banned else "利用禁止を解除"
+    message = f"{len(user_ids)}件中{succeeded}件の{BAN_LABELS[ban_type]}{action}しました"
+    if error:
+        # 途中まで反映済みなので、処理できたIDの結果も返す
+        return FastJSONResponse({
+            "error": f"一括処理が途中で失敗しました: {error}",
+            "message": message,
+            "results": results
+        }, status_code=500)
+    return FastJSONResponse({
+        "message": message,
+        "results": results
+    })
+
+@router.post("/admin/bulk/ban-bot")
+async def bulk_ban_bot(request: Request, ids: list = Form(...), reason: str = Form(...), session_token: str = Cookie(None)):
+    """BOT利用禁止 (一括・理由必須)"""
+    return await bulk_ban_response(request, session_token, ids, "bot", True, reason)
+
+@router.post("/admin/bulk/unban-bot")
+async def bulk_unban_bot(request: Request, ids: list = Form(...), session_token: str = Cookie(None)):
+    """BOT利用禁止解除 (一括)"""
+    return await bulk_ban_response(request, session_token, ids, "bot", False, "BAN解除")
+
+@router.post("/admin/bulk/ban-web")
+async def bulk_ban_web(request: Request, ids: list = Form(...), reason: str = Form(...), session_token: str = Cookie(None)):
+    """Web利用禁止 (一括・理由必須)"""
+    return await bulk_ban_response(request, session_token, ids, "web", True, reason)
+
+@router.post("/admin/bulk/unban-web")
+async def bulk_unban_web(request: Request, ids: list = Form(...), session_token: str = Cookie(None)):
+    """Web利用禁止解除 (一括)"""
+    return await bulk_ban_response(request, session_token, ids, "web", False, "BAN解除")
+
+def cancel_open_trades(admin_id: str, client_ip: str, trade_ids: list, reason: str):
+    """進行中のトレードをチャンクごとに強制キャンセルし、(IDごとの結果, エラー) を返す
+
+    完了・拒否済みのトレードは上書きしない (結果は "not_open")。キャンセルしたトレードは
+    _on_trade_changed で集計と当事者への通知に反映し、保留解除と管理者ログもチャンク単位で行う。
+    途中で失敗した場合はそこで打ち切り、未処理のIDは "error" として返す。
+    """
+    now = datetime.utcnow().isoformat()
+    results = {trade_id: "error" for trade_id in trade_ids}
+    for chunk in chunked(trade_ids):
+        try:
+            res = supabase_client.supabase.table("trades").update({
+                "status": "cancelled"
+            }).in_("id", chunk).in_("status", list(supabase_client.OPEN_TRADE_STATUSES)).execute()
+            cancelled = [trade["id"] for trade in res.data or []]
+            for trade in res.data or []:
+                supabase_client._on_trade_changed(trade)
+            for trade_id in chunk:
+                # not_open: 存在しないか、すでに終了しているトレード
+                results[trade_id] = "ok" if trade_id in cancelled else "not_open"
+
+            if cancelled:
+                # 保留解除
+                supabase_client.supabase.table("trade_holds").delete().in_("trade_id", cancelled).execute()
+
+                # 管理者ログ
+                supabase_client.supabase.table("admin_logs").insert([{
+                    "admin_id": admin_id,
+                    "action": "cancel_trade",
+                    "target_id": str(trade_id),
+                    "reason": reason,
+                    "ip_address": client_ip,
+                    "created_at": now
+                } for trade_id in cancelled]).execute()
+        except Exception as e:
+            print(f"Error cancelling trades: {e}")
+            return results, str(e)
+    return results, None
+
+@router.post("/admin/bulk/cancel-trades")
+async def bulk_cancel_trades(
+    request: Request,
+    ids: list = Form(...),
+    reason: str = Form(default="管理者による強制キャンセル"),
+    session_token: str = Cookie(None)
+):
+    """トレード強制キャンセル (一括)"""
+    admin_id = get_discord_id_from_token(session_token)
+    if not is_admin(admin_id, request):
+        raise HTTPException(status_code=403, detail="管理者権限がありません")
+
     client_ip = get_client_ip(request)
+    targets = parse_bulk_ids(ids)
+    if not targets:
+        return FastJSONResponse({"error": "対象のトレードIDを入力してください"}, status_code=400)
+    if len(targets) > BULK_MAX_TARGETS:
+        return FastJSONResponse({"error": f"一度に処理できるのは{BULK_MAX_TARGETS}件までです"}, status_code=400)
+
+    results = {target: "invalid" for target in targets}
+    trade_ids = [int(target) for target in targets if target.isdigit()]
+    trade_results, error = cancel_open_trades(admin_id, client_ip, trade_ids, reason)
+    results.update({str(trade_id): result for trade_id, result in trade_results.items()})
+    cancelled = [trade_id for trade_id, result in trade_results.items() if result == "ok"]
+
+    message = f"{len(targets)}件中{len(cancelled)}件のトレードを強制キャンセルしました"
+    if error:
+        return FastJSONResponse({
+            "error": f"一括処理が途中で失敗しました: {error}",
+            "message": message,
+            "results": results
+        }, status_code=500)
+    return FastJSONResponse({
+        "message": message,
+        "results": results
+    })
 
-    # トレード情報取得
-    trade = supabase_client.supabase.table("trades").select("*").eq("id", trade_id).single().execute()
+# ========================================
+# エクスポート
+# ========================================
+
+# エクスポート可能なテーブル: (キーセット用の列, 日付絞り込み用の列)
+EXPORT_TABLES = {
+    "players": ("user_id", "created_at"),
+    "trades": ("id", "created_at"),
+    "trade_posts": ("id", "created_at"),
+    "admin_logs": ("id", "created_at"),
+    "ban_history": ("id", "banned_at"),
+}
+EXPORT_COLUMN_PATTERN = re.compile(r"^[a-z_][a-z0-9_]*$")
+
+def export_value(value):
+    """CSVセル用に変換 (リスト・辞書はJSON文字列)"""
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, ensure_ascii=False)
+    return "" if value is None else value
+
+# 出力をまとめる単位 (1行ずつ yield するとスレッドプールの往復と圧縮のフラッシュが行数分発生する)
+EXPORT_FLUSH_ROWS = 1000
+EXPORT_FLUSH_BYTES = 64 * 1024
+
+def export_csv(rows, columns):
+    """行をCSVとして逐次出力 (列未指定時は先頭行の列を使う。EXPORT_FLUSH_ROWS 行か64KBごとに出力)"""
+    buffer = io.StringIO()
+    writer = None
+    pending = 0
+    for row in rows:
+        if writer is None:
+            writer = csv.writer(buffer)
+            columns = columns or list(row.keys())
+            # Excelで文字化けしないようBOMを付ける
+            buffer.write("\ufeff")
+            writer.writerow(columns)
+        writer.writerow([export_value(row.get(column)) for column in columns])
+        pending += 1
+        if pending >= EXPORT_FLUSH_ROWS or buffer.tell() >= EXPORT_FLUSH_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def export_ndjson(rows, columns):
+    """行をNDJSONとして逐次出力 (EXPORT_FLUSH_ROWS 行か64KBごとに出力)"""
+    chunk = bytearray()
+    pending = 0
+    for row in rows:
+        if columns:
+            row = {column: row.get(column) for column in columns}
+        chunk += dumps(row)
+        chunk += b"\n"
+        pending += 1
+        if pending >= EXPORT_FLUSH_ROWS or len(chunk) >= EXPORT_FLUSH_BYTES:
+            yield bytes(chunk)
+            chunk.clear()
+            pending = 0
+    if chunk:
+        yield bytes(chunk)
+
+@router.get("/admin/export/{table}")
+async def export_table(
+    request: Request,
+    table: str,
+    format: str = "csv",
+    columns: str = "",
+    date_from: str = "",
+    date_to: str = "",
+    session_token: str = Cookie(None)
+):
+    """テーブルをCSV/NDJSONでストリーミング出力"""
+    admin_id = get_discord_id_from_token(session_token)
+    if not is_admin(admin_id, request):
+        raise HTTPException(status_code=403, detail="管理者権限がありません")
 
-    if not trade.data:
-        raise HTTPException(status_code=404, detail="トレードが見つかりません")
+    if table not in EXPORT_TABLES:
+        raise HTTPException(status_code=404, detail="エクスポートできないテーブルです")
+    if format not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="format は csv または ndjson を指定してください")
 
-    # 保留解除
-    supabase_client.supabase.table("trade_holds").delete().eq("trade_id", trade_id).execute()
+    selected = [column.strip() for column in columns.split(",") if column.strip()]
+    if any(not EXPORT_COLUMN_PATTERN.match(column) for column in selected):
+        raise HTTPException(status_code=400, detail="列名が不正です")
 
-    # トレードステータスを cancelled に
-    supabase_client.supabase.table("trades").update({
-        "status": "cancelled"
-    }).eq("id", trade_id).execute()
+    try:
+        start = datetime.strptime(date_from, "%Y-%m-%d").isoformat() if date_from else None
+        end = (datetime.strptime(date_to, "%Y-%m-%d") + timedelta(days=1)).isoformat() if date_to else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="日付は YYYY-MM-DD 形式で指定してください")
+
+    key, date_column = EXPORT_TABLES[table]
+    # キーセットページングのためキー列は必ず取得する
+    fetch_columns = ",".join(dict.fromkeys([key] + selected)) if selected else "*"
+    rows = supabase_client.iter_table_rows(
+        table,
+        columns=fetch_columns,
+        key=key,
+        date_column=date_column,
+        date_from=start,
+        date_to=end
+    )
 
     # 管理者ログを記録
     supabase_client.supabase.table("admin_logs").insert({
         "admin_id": admin_id,
-        "action": "cancel_trade",
-        "target_id": str(trade_id),
-        "reason": "管理者による強制キャンセル",
-        "ip_address": client_ip,
+        "action": "export",
+        "target_id": table,
+        "reason": f"format={format} columns={columns or '*'} from={date_from or '-'} to={date_to or '-'}",
+        "ip_address": get_client_ip(request),
         "created_at": datetime.utcnow().isoformat()
     }).execute()
 
-    return JSONResponse({"message": f"トレード ID {trade_id} を強制キャンセルしました"})
+    filename = f"{table}_{datetime.utcnow().strftime('%Y%m%d%H%M%S')}.{format}"
+    if format == "csv":
+        body = export_csv(rows, selected)
+        media_type = "text/csv; charset=utf-8"
+    else:
+        body = export_ndjson(rows, selected)
+        media_type = "application/x-ndjson; charset=utf-8"
+
+    # 同期ジェネレーターはスレッドプールで反復されるため、DB取得中もイベントループを塞がない
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
 
 @router.get("/admin/player/{discord_id}", response_class=HTMLResponse)
 async def view_player_data(request: Request, discord_id: str, session_token: str = Cookie(None)):
@@ -3,7 +3,9 @@ import secrets
 import requests
 from jose import jwt, JWTError
 from fastapi import APIRouter, HTTPException, Request, Response
-from fastapi.responses import RedirectResponse, JSONResponse
+from fastapi.responses import RedirectResponse
+from utils.responses import FastJSONResponse
+from utils.auth import session_discord_id
 import asyncio
 from datetime import datetime, timedelta
 
@@ -24,7 +26,7 @@ DISCORD_API_URL = "https://discord.com/api"
 async def login(response: Response):
     """Discord OAuth2認証ページへリダイレクト（CSRF保護付き）"""
     if not DISCORD_CLIENT_ID or not REDIRECT_URI:
-        return JSONResponse(
+        return FastJSONResponse(
             {"error": "Discord認証が設定されていません。環境変数を確認してください。"},
             status_code=500
         )
@@ -94,7 +96,7 @@ async def callback(code: str, state: str, request: Request):
 
     # 環境変数チェック
     if not all([DISCORD_CLIENT_ID, DISCORD_CLIENT_SECRET, REDIRECT_URI]):
-        return JSONResponse(
+        return FastJSONResponse(
             {"error": "Discord認証設定が不完全です"},
             status_code=500
         )
@@ -150,25 +152,25 @@ async def callback(code: str, state: str, request: Request):
                 await asyncio.sleep(wait_time)
 
                 if attempt == 2:
-                    return JSONResponse(
+                    return FastJSONResponse(
                         {"error": "レート制限により認証に失敗しました"},
                         status_code=429
                     )
             else:
                 print(f"Discord API Error: {e.response.status_code} - {e.response.text}")
-                return JSONResponse(
+                return FastJSONResponse(
                     {"error": f"Discord API Error: {e.response.status_code}"},
                     status_code=e.response.status_code
                 )
         except requests.exceptions.RequestException as e:
             print(f"Network Error: {str(e)}")
-            return JSONResponse(
+            return FastJSONResponse(
                 {"error": f"ネットワークエラー: {str(e)}"},
                 status_code=500
             )
 
     if token_resp is None or not token_resp.ok:
-        return JSONResponse(
+        return FastJSONResponse(
             {"error": "アクセストークンの取得に失敗しました"},
             status_code=500
         )
@@ -178,7 +180,7 @@ async def callback(code: str, state: str, request: Request):
 
     if not access_token:
         print(f"Token response missing access_token: {token_json}")
-        return JSONResponse(
+        return FastJSONResponse(
             {"error": "アクセストークンが見つかりません"},
             status_code=400
         )
@@ -194,7 +196,7 @@ async def callback(code: str, state: str, request: Request):
         user_data = user_resp.json()
     except Exception as e:
         print(f"Failed to fetch user data: {str(e)}")
-        return JSONResponse(
+        return FastJSONResponse(
             {"error": "ユーザー情報の取得に失敗しました"},
             status_code=500
         )
@@ -237,9 +239,8 @@ async def logout():
 async def me(token: str = None):
     """ユーザー情報取得（デバッグ用）"""
     if not token:
-        return JSONResponse({"error": "ログインしていません"}, status_code=401)
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return {"status": "success", "discord_id": payload["discord_id"]}
-    except Exception:
-        return JSONResponse({"error": "無効なトークン"}, status_code=401)
\ No newline at end of file
+        return FastJSONResponse({"error": "ログインしていません"}, status_code=401)
+    discord_id = session_discord_id(token)
+    if not discord_id:
+        return FastJSONResponse({"error": "無効なトークン"}, status_code=401)
+    return {"status": "success", "discord_id": discord_id}
\ No newline at end of file
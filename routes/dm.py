@@ -1,49 +1,75 @@
 from fastapi import APIRouter, Depends, Request, Form
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
-from fastapi.templating import Jinja2Templates
+from fastapi.responses import HTMLResponse, RedirectResponse
+from utils.responses import FastJSONResponse
 from utils.auth import get_current_user
 import supabase_client
+from utils.templates import templates
 
 router = APIRouter()
-templates = Jinja2Templates(directory="templates")
+
+# 1ページあたりのメッセージ数
+MESSAGES_PER_PAGE = 20
+
+def paginate(rows):
+    """1件多く取得した結果を1ページ分と次ページのカーソルに分ける"""
+    if len(rows) > MESSAGES_PER_PAGE:
+        rows = rows[:MESSAGES_PER_PAGE]
+        return rows, rows[-1]["id"]
+    return rows, None
 
 @router.get("/dm/inbox", response_class=HTMLResponse)
-async def dm_inbox(request: Request, discord_id: str = Depends(get_current_user)):
+async def dm_inbox(request: Request, before: int = None, discord_id: str = Depends(get_current_user)):
     """受信箱"""
     player = supabase_client.get_player(discord_id)
     if not player:
         return RedirectResponse(url="/dashboard")
 
-    # 受信したメッセージを取得
-    received = supabase_client.get_received_messages(discord_id)
+    # 受信したメッセージを取得 (次ページ判定のため1件多く取得)
+    received, next_cursor = paginate(supabase_client.get_received_messages(
+        discord_id, limit=MESSAGES_PER_PAGE + 1, before_id=before
+    ))
 
-    # 未読件数
+    # 未読件数 (プロセス内でキャッシュ済み)
     unread_count = supabase_client.get_unread_count(discord_id)
 
+    # 差出人のプレイヤー情報を1回でまとめて取得
+    counterparts = supabase_client.get_players(msg.get("sender_id") for msg in received)
+
     return templates.TemplateResponse("dm_inbox.html", {
         "request": request,
         "discord_id": discord_id,
         "player": player,
         "messages": received,
-        "unread_count": unread_count
+        "unread_count": unread_count,
+        "counterparts": counterparts,
+        "next_cursor": next_cursor,
+        "is_first_page": before is None
     })
 
 
 @router.get("/dm/sent", response_class=HTMLResponse)
-async def dm_sent(request: Request, discord_id: str = Depends(get_current_user)):
+async def dm_sent(request: Request, before: int = None, discord_id: str = Depends(get_current_user)):
     """送信箱"""
     player = supabase_client.get_player(discord_id)
     if not player:
         return RedirectResponse(url="/dashboard")
 
-    # 送信したメッセージを取得
-    sent = supabase_client.get_sent_messages(discord_id)
+    # 送信したメッセージを取得 (次ページ判定のため1件多く取得)
+    sent, next_cursor = paginate(supabase_client.get_sent_messages(
+        discord_id, limit=MESSAGES_PER_PAGE + 1, before_id=before
+    ))
+
+    # 宛先のプレイヤー情報を1回でまとめて取得
+    counterparts = supabase_client.get_players(msg.get("receiver_id") for msg in sent)
 
     return templates.TemplateResponse("dm_sent.html", {
         "request": request,
         "discord_id": discord_id,
         "player": player,
-        "messages": sent
+        "messages": sent,
+        "counterparts": counterparts,
+        "next_cursor": next_cursor,
+        "is_first_page": before is None
     })
 
 
@@ -73,12 +99,12 @@ async def send_dm(
         result = supabase_client.send_direct_message(discord_id, receiver_id, message)
 
         if "error" in result:
-            return JSONResponse({"error": result["error"]}, status_code=400)
+            return FastJSONResponse({"error": result["error"]}, status_code=400)
 
         return RedirectResponse(url="/dm/sent", status_code=303)
 
     except Exception as e:
-        return JSONResponse({"error": str(e)}, status_code=500)
+        return FastJSONResponse({"error": str(e)}, status_code=500)
 
 
 @router.post("/dm/read/{message_id}")
@@ -88,12 +114,12 @@ async def mark_read(message_id: int, discord_id: str = Depends(get_current_user)
         result = supabase_client.mark_message_as_read(message_id, discord_id)
 
         if "error" in result:
-            return JSONResponse({"error": result["error"]}, status_code=403)
+            return FastJSONResponse({"error": result["error"]}, status_code=403)
 
-        return JSONResponse({"success": True})
+        return FastJSONResponse({"success": True})
 
     except Exception as e:
-        return JSONResponse({"error": str(e)}, status_code=500)
+        return FastJSONResponse({"error": str(e)}, status_code=500)
 
 
 @router.post("/dm/delete/{message_id}")
@@ -103,9 +129,9 @@ async def delete_dm(message_id: int, discord_id: str = Depends(get_current_user)
         result = supabase_client.delete_message_for_user(message_id, discord_id)
 
         if "error" in result:
-            return JSONResponse({"error": result["error"]}, status_code=403)
+            return FastJSONResponse({"error": result["error"]}, status_code=403)
 
         return RedirectResponse(url="/dm/inbox", status_code=303)
 
     except Exception as e:
-        return JSONResponse({"error": str(e)}, status_code=500)
\ No newline at end of file
+        return FastJSONResponse({"error": str(e)}, status_code=500)
\ No newline at end of file
@@ -0,0 +1,47 @@
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import StreamingResponse
+from utils.responses import FastJSONResponse
+from utils.auth import get_current_user
+from utils.events import notifications, format_sse
+import supabase_client
+
+router = APIRouter()
+
+# 接続維持のためのコメント送信間隔 (秒)
+KEEPALIVE_INTERVAL = 15
+
+@router.get("/events")
+async def event_stream(request: Request, discord_id: str = Depends(get_current_user)):
+    """新着DM・未読件数・トレード状況をプッシュ配信 (SSE)"""
+    subscription = notifications.subscribe(discord_id)
+    if subscription is None:
+        return FastJSONResponse(
+            {"error": "接続数が上限に達しています。しばらくしてから再接続してください"},
+            status_code=503,
+            headers={"Retry-After": "30"}
+        )
+
+    async def stream():
+        try:
+            # 接続直後に現在の未読件数を送る
+            yield "retry: 5000\n\n"
+            yield format_sse("unread", {"count": supabase_client.get_unread_count(discord_id)})
+
+            while not await request.is_disconnected():
+                item = await subscription.get(timeout=KEEPALIVE_INTERVAL)
+                if item is None:
+                    yield ": keepalive\n\n"
+                    continue
+                event, data = item
+                yield format_sse(event, data)
+        finally:
+            notifications.unsubscribe(subscription)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
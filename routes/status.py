@@ -1,67 +1,72 @@
 from fastapi import APIRouter, Depends, Request
-from fastapi.responses import HTMLResponse, JSONResponse
-from fastapi.templating import Jinja2Templates
-from utils.auth import get_current_user
+from fastapi.responses import HTMLResponse
+from utils.responses import FastJSONResponse, dumps, versioned_response
+from utils.auth import get_current_user, session_discord_id
 import supabase_client
+from utils.templates import templates
 
 router = APIRouter()
-templates = Jinja2Templates(directory="templates")
 
 @router.get("/status")
-async def get_user_status(discord_id: str = Depends(get_current_user)):
-    """ユーザーステータスAPI"""
+async def get_user_status(request: Request, discord_id: str = Depends(get_current_user)):
+    """ユーザーステータスAPI (行バージョンが同じなら 304)"""
     player = supabase_client.get_player(discord_id)
 
     if not player:
-        return JSONResponse(
+        return FastJSONResponse(
             content={
                 "status": "error",
                 "message": "プレイヤーデータが見つかりません",
                 "discord_id": discord_id
             },
-            media_type="application/json; charset=utf-8",
             status_code=404
         )
 
-    return JSONResponse(
-        content={
+    return versioned_response(
+        request,
+        ("status", discord_id),
+        supabase_client.row_version(player),
+        lambda: dumps({
             "status": "success",
             "message": "ログイン済みです",
             "discord_id": discord_id,
             "player": player
-        },
-        media_type="application/json; charset=utf-8"
+        }),
+        media_type=FastJSONResponse.media_type,
+        updated_at=player.get("updated_at")
     )
 
 @router.get("/dashboard", response_class=HTMLResponse)
 async def dashboard(request: Request, discord_id: str = Depends(get_current_user)):
-    """ユーザーがログイン後に到達するダッシュボードページ"""
+    """ユーザーがログイン後に到達するダッシュボードページ (行バージョンが同じなら 304)"""
     player = supabase_client.get_player(discord_id)
 
     if not player:
         supabase_client.create_player(discord_id)
-        player = supabase_client.get_player(discord_id)
-
-    equipped = supabase_client.get_equipped_items(discord_id)
-
-    return templates.TemplateResponse("dashboard.html", {
-        "request": request,
-        "discord_id": discord_id,
-        "player": player,
-        "equipped_weapon": equipped.get("weapon", "なし"),
-        "equipped_armor": equipped.get("armor", "なし")
-    })
+        player = supabase_client.get_player(discord_id) or {}
+
+    # 表示内容はすべてプレイヤー行から決まるので、行バージョンをそのまま ETag に使う
+    def render() -> bytes:
+        return templates.env.get_template("dashboard.html").render(
+            request=request,
+            discord_id=discord_id,
+            player=player,
+            equipped_weapon=player.get("equipped_weapon") or "なし",
+            equipped_armor=player.get("equipped_armor") or "なし"
+        ).encode("utf-8")
+
+    return versioned_response(
+        request,
+        ("dashboard", discord_id),
+        supabase_client.row_version(player),
+        render,
+        media_type="text/html; charset=utf-8",
+        updated_at=player.get("updated_at")
+    )
 
 from fastapi import Cookie, Request
 from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
-from jose import jwt, JWTError
 from datetime import datetime, timedelta
-import os
-
-templates = Jinja2Templates(directory="templates")
-SECRET_KEY = os.getenv("SESSION_SECRET")
-ALGORITHM = "HS256"
 
 @router.get("/dashboard", response_class=HTMLResponse)
 async def dashboard(request: Request, session_token: str = Cookie(None)):
@@ -73,10 +78,8 @@ async def dashboard(request: Request, session_token: str = Cookie(None)):
     if not session_token:
         return RedirectResponse(url="/auth/login", status_code=302)
 
-    try:
-        payload = jwt.decode(session_token, SECRET_KEY, algorithms=[ALGORITHM])
-        discord_id = payload.get("discord_id")
-    except JWTError:
+    discord_id = session_discord_id(session_token)
+    if not discord_id:
         return RedirectResponse(url="/auth/login", status_code=302)
 
     client_ip = get_client_ip(request)
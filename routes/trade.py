@@ -1,11 +1,11 @@
 from fastapi import APIRouter, Depends, Request, Form
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
+from fastapi.responses import HTMLResponse, RedirectResponse
+from utils.responses import FastJSONResponse
 from utils.auth import get_current_user
 import supabase_client
+from utils.templates import templates
 
 router = APIRouter()
-templates = Jinja2Templates(directory="templates")
 
 @router.post("/trade/request")
 async def trade_request(
@@ -17,7 +17,7 @@ async def trade_request(
     try:
         sender_player = supabase_client.get_player(sender_id)
         if not sender_player:
-            return JSONResponse(
+            return FastJSONResponse(
                 {"error": "送信者が見つかりません"},
                 status_code=404
             )
@@ -26,14 +26,14 @@ async def trade_request(
         inventory = sender_player.get("inventory", [])
         for item in item_names:
             if item not in inventory:
-                return JSONResponse(
+                return FastJSONResponse(
                     {"error": f"アイテム '{item}' を所持していません"},
                     status_code=400
                 )
 
         receiver_player = supabase_client.get_player(receiver_id)
         if not receiver_player:
-            return JSONResponse(
+            return FastJSONResponse(
                 {"error": "受信者が見つかりません"},
                 status_code=404
             )
@@ -46,12 +46,12 @@ async def trade_request(
         if trade:
             return RedirectResponse(url="/trade", status_code=303)
         else:
-            return JSONResponse(
+            return FastJSONResponse(
                 {"error": "トレード提案の作成に失敗しました"},
                 status_code=500
             )
     except Exception as e:
-        return JSONResponse(
+        return FastJSONResponse(
             {"error": str(e)},
             status_code=500
         )
@@ -71,7 +71,7 @@ async def receiver_respond(
             if success:
                 return RedirectResponse(url="/trade", status_code=303)
             else:
-                return JSONResponse(
+                return FastJSONResponse(
                     {"error": "トレードの拒否に失敗しました"},
                     status_code=400
                 )
@@ -80,7 +80,7 @@ async def receiver_respond(
             # 承認 + アイテム提示
             receiver_player = supabase_client.get_player(user_id)
             if not receiver_player:
-                return JSONResponse(
+                return FastJSONResponse(
                     {"error": "プレイヤーが見つかりません"},
                     status_code=404
                 )
@@ -89,7 +89,7 @@ async def receiver_respond(
             inventory = receiver_player.get("inventory", [])
             for item in item_names:
                 if item not in inventory:
-                    return JSONResponse(
+                    return FastJSONResponse(
                         {"error": f"アイテム '{item}' を所持していません"},
                         status_code=400
                     )
@@ -99,12 +99,12 @@ async def receiver_respond(
             if success:
                 return RedirectResponse(url="/trade", status_code=303)
             else:
-                return JSONResponse(
+                return FastJSONResponse(
                     {"error": "アイテムの設定に失敗しました"},
                     status_code=400
                 )
     except Exception as e:
-        return JSONResponse(
+        return FastJSONResponse(
             {"error": str(e)},
             status_code=500
         )
@@ -122,7 +122,7 @@ async def sender_approve(
             if success:
                 return RedirectResponse(url="/trade", status_code=303)
             else:
-                return JSONResponse(
+                return FastJSONResponse(
                     {"error": "トレードのキャンセルに失敗しました"},
                     status_code=400
                 )
@@ -133,12 +133,12 @@ async def sender_approve(
             if success:
                 return RedirectResponse(url="/trade", status_code=303)
             else:
-                return JSONResponse(
+                return FastJSONResponse(
                     {"error": "トレードの完了に失敗しました"},
                     status_code=400
                 )
     except Exception as e:
-        return JSONResponse(
+        return FastJSONResponse(
             {"error": str(e)},
             status_code=500
         )
@@ -148,12 +148,11 @@ async def trade_history(user_id: str = Depends(get_current_user)):
     """トレード履歴API"""
     try:
         history = supabase_client.get_trade_history(user_id)
-        return JSONResponse(
-            {"status": "success", "history": history},
-            media_type="application/json; charset=utf-8"
+        return FastJSONResponse(
+            {"status": "success", "history": history}
         )
     except Exception as e:
-        return JSONResponse(
+        return FastJSONResponse(
             {"error": str(e)},
             status_code=500
         )
@@ -165,14 +164,22 @@ async def trade_page(request: Request, discord_id: str = Depends(get_current_use
     if not player:
         return RedirectResponse(url="/dashboard")
 
-    # 自分に関連するトレードを取得
-    my_trades = supabase_client.get_my_trades(discord_id)
+    # トレード履歴を1クエリで取得し、進行中のものを状態別に振り分ける
     trade_history = supabase_client.get_trade_history(discord_id)
+    my_trades = supabase_client.get_my_trades(discord_id, trades=trade_history)
 
     # 利用可能なインベントリ
     available_inventory = supabase_client.get_available_inventory(discord_id)
     held_items = supabase_client.get_held_items(discord_id)
 
+    # 取引相手のプレイヤー情報を1回でまとめて取得 (表示するのは進行中のトレードの相手だけ)
+    counterpart_ids = {
+        trade.get(key) for trades in my_trades.values() for trade in trades
+        for key in ("sender_id", "receiver_id")
+    }
+    counterpart_ids.discard(discord_id)
+    counterparts = supabase_client.get_players(counterpart_ids)
+
     return templates.TemplateResponse("trade.html", {
         "request": request,
         "discord_id": discord_id,
@@ -180,5 +187,6 @@ async def trade_page(request: Request, discord_id: str = Depends(get_current_use
         "available_inventory": available_inventory,
         "held_items": held_items,
         "my_trades": my_trades,  # 全てのトレード (状態別)
-        "trade_history": trade_history
+        "trade_history": trade_history,
+        "counterparts": counterparts
     })
\ No newline at end of file
@@ -1,21 +1,45 @@
 from fastapi import APIRouter, Depends, Request, Form
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
-from fastapi.templating import Jinja2Templates
+from fastapi.responses import HTMLResponse, RedirectResponse
+from utils.responses import FastJSONResponse
 from utils.auth import get_current_user
 import supabase_client
+from utils.templates import templates
 
 router = APIRouter()
-templates = Jinja2Templates(directory="templates")
+
+# 1ページあたりの投稿数
+POSTS_PER_PAGE = 20
 
 @router.get("/trade-board", response_class=HTMLResponse)
-async def trade_board_page(request: Request, discord_id: str = Depends(get_current_user)):
+async def trade_board_page(
+    request: Request,
+    before: int = None,
+    offering: str = None,
+    wanting: str = None,
+    poster: str = None,
+    discord_id: str = Depends(get_current_user)
+):
     """トレード掲示板ページ"""
     player = supabase_client.get_player(discord_id)
     if not player:
         return RedirectResponse(url="/dashboard")
 
-    # 有効な投稿を取得
-    posts = supabase_client.get_active_trade_posts()
+    offering = (offering or "").strip()
+    wanting = (wanting or "").strip()
+    poster = (poster or "").strip()
+
+    # 有効な投稿を取得 (次ページ判定のため1件多く取得)
+    posts = supabase_client.get_active_trade_posts(
+        limit=POSTS_PER_PAGE + 1,
+        before_id=before,
+        offering=offering or None,
+        wanting=wanting or None,
+        poster=poster or None
+    )
+    next_cursor = None
+    if len(posts) > POSTS_PER_PAGE:
+        posts = posts[:POSTS_PER_PAGE]
+        next_cursor = posts[-1]["id"]
 
     # 自分の投稿を取得
     my_posts = supabase_client.get_my_trade_posts(discord_id)
@@ -23,16 +47,40 @@ async def trade_board_page(request: Request, discord_id: str = Depends(get_curre
     # 利用可能なインベントリ
     available_inventory = supabase_client.get_available_inventory(discord_id)
 
+    # 投稿者のプレイヤー情報を1回でまとめて取得
+    posters = supabase_client.get_players(post.get("user_id") for post in posts)
+
     return templates.TemplateResponse("trade_board.html", {
         "request": request,
         "discord_id": discord_id,
         "player": player,
         "posts": posts,
+        "next_cursor": next_cursor,
+        "is_first_page": before is None,
+        "filters": {"offering": offering, "wanting": wanting, "poster": poster},
         "my_posts": my_posts,
-        "available_inventory": available_inventory
+        "available_inventory": available_inventory,
+        "posters": posters
     })
 
 
+@router.get("/trade-board/matches")
+async def trade_board_matches(
+    wishlist: str = None,
+    limit: int = 20,
+    discord_id: str = Depends(get_current_user)
+):
+    """所持アイテムで取引できる投稿を一致数順に返すAPI"""
+    try:
+        limit = max(1, min(limit, 100))
+        matches = supabase_client.find_trade_post_matches(discord_id, wishlist, limit)
+        return FastJSONResponse(
+            {"status": "success", "matches": matches}
+        )
+    except Exception as e:
+        return FastJSONResponse({"error": str(e)}, status_code=500)
+
+
 @router.post("/trade-board/post")
 async def create_post(
     title: str = Form(...),
@@ -48,12 +96,12 @@ async def create_post(
         )
 
         if "error" in result:
-            return JSONResponse({"error": result["error"]}, status_code=400)
+            return FastJSONResponse({"error": result["error"]}, status_code=400)
 
         return RedirectResponse(url="/trade-board", status_code=303)
 
     except Exception as e:
-        return JSONResponse({"error": str(e)}, status_code=500)
+        return FastJSONResponse({"error": str(e)}, status_code=500)
 
 
 @router.post("/trade-board/delete/{post_id}")
@@ -63,9 +111,9 @@ async def delete_post(post_id: int, discord_id: str = Depends(get_current_user))
         result = supabase_client.delete_trade_post(post_id, discord_id)
 
         if "error" in result:
-            return JSONResponse({"error": result["error"]}, status_code=403)
+            return FastJSONResponse({"error": result["error"]}, status_code=403)
 
         return RedirectResponse(url="/trade-board", status_code=303)
 
     except Exception as e:
-        return JSONResponse({"error": str(e)}, status_code=500)
\ No newline at end of file
+        return FastJSONResponse({"error": str(e)}, status_code=500)
\ No newline at end of file
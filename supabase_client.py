@@ -1,9 +1,28 @@
 # supabase_client.py (web側)
-from supabase import create_client
+from supabase import create_client, ClientOptions
+from postgrest.exceptions import APIError
+from utils.cache import TTLCache
+from utils.events import notifications, ReplayBuffer
+from utils.trade_post_index import TradePostIndex, split_item_names, parse_timestamp
+from utils.search_index import NgramIndex
+from utils.stats import AdminStats
+from utils.bans import ban_registry
+from utils import metrics, tracing
+from utils.circuit import CircuitBreaker, mark_stale, register_breaker
+from datetime import datetime, timedelta
+import hashlib
 import os
+import time
 
 _supabase_client = None
 
+# 1回の問い合わせの待ち時間の上限 (秒)。既定の120秒待つとワーカー全体が詰まる
+SUPABASE_TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", "10"))
+
+# 障害時に待たずに失敗させるためのサーキットブレーカー (全テーブル共通)
+supabase_breaker = CircuitBreaker("supabase")
+register_breaker(supabase_breaker)
+
 def get_supabase_client():
     """Supabaseクライアントを取得（遅延初期化）"""
     global _supabase_client
@@ -18,9 +37,94 @@ def get_supabase_client():
         # 開発環境で環境変数未設定の場合、Noneを返す
         return None
 
-    _supabase_client = create_client(url, key)
+    _supabase_client = create_client(
+        url, key, options=ClientOptions(postgrest_client_timeout=SUPABASE_TIMEOUT)
+    )
     return _supabase_client
 
+# 操作種別として記録するクエリビルダーのメソッド
+QUERY_OPERATIONS = ("select", "insert", "update", "upsert", "delete")
+
+# PostgREST がDBに接続できない・DBが応答しないときのエラーコード
+# PGRST000-003: 接続失敗・接続プールのタイムアウト / 08xxx: 接続例外 / 53xxx: リソース不足
+# 57014: ステートメントタイムアウト / 57P01-57P03: DBの停止・再起動中
+UNAVAILABLE_ERROR_CODES = ("PGRST000", "PGRST001", "PGRST002", "PGRST003", "57014", "57P01", "57P02", "57P03")
+UNAVAILABLE_ERROR_CLASSES = ("08", "53")
+
+def is_backend_unavailable(error) -> bool:
+    """バックエンドの障害 (遮断器の失敗として数える) か
+
+    APIError でもゲートウェイの5xx (JSON以外の応答は code にHTTPステータスが入る) や
+    接続系のコードは障害とみなす。4xx・制約違反などクエリ側の誤りは応答があったので成功扱い。
+    """
+    if not isinstance(error, APIError):
+        return True
+    code = str(error.code or "")
+    if code.isdigit() and len(code) == 3:
+        return code.startswith("5")
+    return code in UNAVAILABLE_ERROR_CODES or code[:2] in UNAVAILABLE_ERROR_CLASSES
+
+class InstrumentedQuery:
+    """クエリビルダーのラッパー (execute() の所要時間とエラーをテーブル・操作ごとに記録)
+
+    DB_TRACE 有効時はメソッド呼び出しの履歴も保持し、リクエスト単位のトレースに渡す。
+    """
+
+    __slots__ = ("_builder", "table", "operation", "calls")
+
+    def __init__(self, builder, table: str, operation: str = "select", calls=()):
+        self._builder = builder
+        self.table = table
+        self.operation = operation
+        self.calls = calls
+
+    def __getattr__(self, name):
+        attr = getattr(self._builder, name)
+        if not callable(attr):
+            # .not_ のようにビルダーを返すプロパティもラップする
+            if hasattr(attr, "execute"):
+                return InstrumentedQuery(attr, self.table, self.operation, self.calls)
+            return attr
+
+        operation = name if name in QUERY_OPERATIONS else self.operation
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            if hasattr(result, "execute"):
+                calls = self.calls
+                if tracing.current_trace() is not None:
+                    calls = calls + ((name, args),)
+                return InstrumentedQuery(result, self.table, operation, calls)
+            return result
+
+        return call
+
+    def execute(self):
+        # 遮断中はここで CircuitOpenError (タイムアウトを待たない)
+        supabase_breaker.before_call()
+        trace = tracing.current_trace()
+        rows = 0
+        unavailable = False
+        start = time.perf_counter()
+        try:
+            res = self._builder.execute()
+            data = getattr(res, "data", None)
+            rows = len(data) if isinstance(data, list) else int(bool(data))
+            return res
+        except Exception as e:
+            metrics.backend_errors.inc(table=self.table, operation=self.operation)
+            unavailable = is_backend_unavailable(e)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            if unavailable:
+                supabase_breaker.record_failure()
+            else:
+                supabase_breaker.record_success(elapsed)
+            metrics.backend_duration.observe(elapsed, table=self.table, operation=self.operation)
+            if trace is not None:
+                trace.record(self.table, self.operation, self.calls, elapsed, rows)
+
 # Create a module-level wrapper that safely handles None
 class SupabaseClientWrapper:
     def __getattr__(self, name):
@@ -29,26 +133,105 @@ class SupabaseClientWrapper:
             raise RuntimeError("Supabase未設定: SUPABASE_URLとSUPABASE_KEYを環境変数に設定してください")
         return getattr(client, name)
 
+    def table(self, table_name: str) -> InstrumentedQuery:
+        """テーブルのクエリビルダー (計測付き)"""
+        return InstrumentedQuery(self.__getattr__("table")(table_name), table_name)
+
 supabase = SupabaseClientWrapper()
 
+# プレイヤー行の共有キャッシュ (一覧表示の相手情報用)
+# BOT側からも更新されるため短めのTTLにしている
+# 期限切れ後も10分間は残し、DB障害時に古いデータとして返す
+_player_cache = TTLCache(maxsize=5000, ttl=30, stale_ttl=600)
+metrics.register_cache("players", _player_cache)
+
+# in_() フィルタ1回あたりのID数 (URL長の上限対策)
+PLAYER_BATCH_SIZE = 100
+
 def get_player(user_id):
-    """プレイヤーデータを取得"""
-    res = supabase.table("players").select("*").eq("user_id", str(user_id)).execute()
-    return res.data[0] if res.data else None
+    """プレイヤーデータを取得 (DB障害時は直近のキャッシュを古いデータとして返す)"""
+    try:
+        res = supabase.table("players").select("*").eq("user_id", str(user_id)).execute()
+    except Exception:
+        player = _player_cache.get_stale(str(user_id))
+        if player is None:
+            raise
+        mark_stale("players")
+        return player
+    player = res.data[0] if res.data else None
+    if player:
+        _player_cache.set(str(user_id), player)
+    return player
+
+def get_players(user_ids):
+    """複数プレイヤーをまとめて取得 (user_id -> プレイヤーデータの辞書)
+
+    キャッシュに無いIDだけを in_() フィルタでまとめて取得する。
+    """
+    ids = list(dict.fromkeys(str(user_id) for user_id in user_ids if user_id))
+    players = _player_cache.get_many(ids)
+    missing = [user_id for user_id in ids if user_id not in players]
+
+    for i in range(0, len(missing), PLAYER_BATCH_SIZE):
+        chunk = missing[i:i + PLAYER_BATCH_SIZE]
+        try:
+            res = supabase.table("players").select("*").in_("user_id", chunk).execute()
+            for player in res.data or []:
+                key = str(player["user_id"])
+                _player_cache.set(key, player)
+                players[key] = player
+        except Exception as e:
+            print(f"Error getting players: {e}")
+            for key in chunk:
+                player = _player_cache.get_stale(key)
+                if player is not None:
+                    players[key] = player
+                    mark_stale("players")
+
+    return players
 
 def create_player(user_id: int):
     """新規プレイヤーを作成（デフォルト値はテーブル定義に従う）"""
-    supabase.table("players").insert({
+    res = supabase.table("players").insert({
         "user_id": str(user_id)
     }).execute()
+    if res.data:
+        admin_stats.set_player(user_id, res.data[0])
 
 def update_player(user_id, **kwargs):
-    """プレイヤーデータを更新"""
-    supabase.table("players").update(kwargs).eq("user_id", str(user_id)).execute()
+    """プレイヤーデータを更新 (行バージョンの updated_at も進める)"""
+    _player_cache.delete(str(user_id))
+    supabase.table("players").update(versioned(kwargs)).eq("user_id", str(user_id)).execute()
+    admin_stats.update_player(user_id, kwargs)
 
 def delete_player(user_id):
     """プレイヤーデータを削除"""
+    _player_cache.delete(str(user_id))
     supabase.table("players").delete().eq("user_id", str(user_id)).execute()
+    admin_stats.remove_player(user_id)
+
+# ========================================
+# 行バージョン (条件付きGET用)
+# ========================================
+# players.updated_at を行のバージョンとして使う。
+# 列とBOT側の更新でも進めるトリガーは migrations/001_players_updated_at.sql で追加する
+# (update_player などが updated_at を書き込むため、デプロイ前に適用しておくこと)。
+
+def versioned(fields: dict) -> dict:
+    """更新内容に updated_at を追加する (テーブルを直接更新する場合も使う)"""
+    return {**fields, "updated_at": datetime.utcnow().isoformat()}
+
+def row_version(row: dict) -> str:
+    """行のバージョン (updated_at が無い行は内容のハッシュで代用)"""
+    updated_at = row.get("updated_at")
+    if updated_at:
+        return str(updated_at)
+    digest = hashlib.sha256(repr(sorted(row.items())).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+def invalidate_player_cache(user_id):
+    """プレイヤーキャッシュを破棄 (テーブルを直接更新した場合に使用)"""
+    _player_cache.delete(str(user_id))
 
 def add_item_to_inventory(user_id, item_name):
     """インベントリにアイテムを追加"""
@@ -96,6 +279,26 @@ def equip_armor(user_id, armor_name):
 # トレード関連機能
 # ==============================
 
+# 進行中とみなすトレードステータス
+# pending: 受信者の応答待ち / receiver_accepted: 送信者の最終確認待ち
+OPEN_TRADE_STATUSES = ("pending", "receiver_accepted")
+
+# 管理画面の集計値 (プレイヤー・トレードの書き込み時に差分更新)
+admin_stats = AdminStats(OPEN_TRADE_STATUSES)
+
+def _on_trade_changed(trade):
+    """トレードの作成・ステータス変更を集計に反映し、当事者双方に通知"""
+    admin_stats.set_trade_status(trade.get("id"), trade.get("status"))
+    data = {
+        "id": trade.get("id"),
+        "status": trade.get("status"),
+        "sender_id": trade.get("sender_id"),
+        "receiver_id": trade.get("receiver_id")
+    }
+    for user_id in {trade.get("sender_id"), trade.get("receiver_id")}:
+        if user_id:
+            notifications.publish(user_id, "trade", data)
+
 def create_trade_request(sender_id, receiver_id, item_name, item_type="item"):
     """トレードリクエストを作成"""
     try:
@@ -109,6 +312,8 @@ def create_trade_request(sender_id, receiver_id, item_name, item_type="item"):
             "created_at": datetime.utcnow().isoformat()
         }
         response = supabase.table("trades").insert(trade_data).execute()
+        if response.data:
+            _on_trade_changed(response.data[0])
         return response.data[0] if response.data else None
     except Exception as e:
         print(f"Error creating trade: {e}")
@@ -144,7 +349,9 @@ def update_trade_status(trade_id, status):
             "status": status,
             "updated_at": datetime.utcnow().isoformat()
         }
-        supabase.table("trades").update(update_data).eq("id", trade_id).execute()
+        response = supabase.table("trades").update(update_data).eq("id", trade_id).execute()
+        for trade in response.data or []:
+            _on_trade_changed(trade)
         return True
     except Exception as e:
         print(f"Error updating trade status: {e}")
@@ -336,15 +543,47 @@ def cleanup_expired_holds():
         print(f"Error cleaning up expired holds: {e}")
         return False
 
-# Placeholder functions for other features (add implementation as needed)
-def get_my_trades(user_id):
-    """自分に関連するトレードを取得"""
-    return {
+def partition_my_trades(user_id, trades):
+    """トレード一覧を trade.html が期待する状態別バケットに振り分け"""
+    user_id = str(user_id)
+    my_trades = {
         "received_pending": [],
         "sent_waiting_receiver": [],
         "sent_waiting_sender": []
     }
 
+    for trade in trades:
+        status = trade.get("status")
+        if status == "pending":
+            if str(trade.get("receiver_id")) == user_id:
+                my_trades["received_pending"].append(trade)
+            elif str(trade.get("sender_id")) == user_id:
+                my_trades["sent_waiting_receiver"].append(trade)
+        elif status == "receiver_accepted" and str(trade.get("sender_id")) == user_id:
+            my_trades["sent_waiting_sender"].append(trade)
+
+    return my_trades
+
+def get_my_trades(user_id, trades=None):
+    """自分に関連するトレードを取得
+
+    trades に get_trade_history の結果を渡すとクエリを発行せずに振り分ける。
+    省略時は進行中のトレードだけを1クエリで取得する。
+    """
+    if trades is None:
+        try:
+            response = supabase.table("trades").select("*").or_(
+                f"sender_id.eq.{user_id},receiver_id.eq.{user_id}"
+            ).in_("status", list(OPEN_TRADE_STATUSES)).order("created_at", desc=True).execute()
+            trades = response.data if response.data else []
+        except Exception as e:
+            print(f"Error getting my trades: {e}")
+            trades = []
+
+    return partition_my_trades(user_id, trades)
+
+# Placeholder functions for other features (add implementation as needed)
+
 def get_available_inventory(user_id):
     """利用可能なインベントリを取得"""
     player = get_player(user_id)
@@ -368,46 +607,751 @@ def complete_trade(trade_id):
     """トレードを完了"""
     return False
 
-def get_received_messages(user_id):
-    """受信したメッセージを取得"""
-    return []
+# ==============================
+# ダイレクトメッセージ
+# ==============================
 
-def get_sent_messages(user_id):
-    """送信したメッセージを取得"""
-    return []
+# DM本文の最大文字数
+DM_MAX_LENGTH = 1000
+
+# ユーザーごとの未読件数
+# 送信・既読・削除のたびに増減させ、TTL切れ時のみDBで数え直す
+_unread_counts = TTLCache(maxsize=10000, ttl=600)
+metrics.register_cache("unread_counts", _unread_counts)
+
+def _adjust_unread_count(user_id, delta):
+    """キャッシュ済みの未読件数を増減 (未キャッシュなら次回DBで数える)"""
+    key = str(user_id)
+    count = _unread_counts.get(key)
+    if count is not None:
+        count = max(0, count + delta)
+        _unread_counts.set(key, count)
+        notifications.publish(key, "unread", {"count": count})
+
+def _get_messages(column, deleted_flag, user_id, limit=None, before_id=None):
+    query = supabase.table("direct_messages").select("*").eq(
+        column, str(user_id)
+    ).eq(deleted_flag, False).is_("deleted_at", "null")
+    if before_id is not None:
+        query = query.lt("id", before_id)
+    query = query.order("id", desc=True)
+    if limit is not None:
+        query = query.limit(limit)
+    res = query.execute()
+    return res.data if res.data else []
+
+def get_received_messages(user_id, limit=None, before_id=None):
+    """受信したメッセージを新しい順に取得 (before_id より古いもののみ)"""
+    try:
+        return _get_messages("receiver_id", "receiver_deleted", user_id, limit, before_id)
+    except Exception as e:
+        print(f"Error getting received messages: {e}")
+        return []
+
+def get_sent_messages(user_id, limit=None, before_id=None):
+    """送信したメッセージを新しい順に取得 (before_id より古いもののみ)"""
+    try:
+        return _get_messages("sender_id", "sender_deleted", user_id, limit, before_id)
+    except Exception as e:
+        print(f"Error getting sent messages: {e}")
+        return []
 
 def get_unread_count(user_id):
-    """未読件数を取得"""
-    return 0
+    """未読件数を取得 (キャッシュ済みならクエリなし)"""
+    key = str(user_id)
+    count = _unread_counts.get(key)
+    if count is not None:
+        return count
+
+    try:
+        res = supabase.table("direct_messages").select("id", count="exact").eq(
+            "receiver_id", key
+        ).eq("is_read", False).eq("receiver_deleted", False).is_("deleted_at", "null").limit(1).execute()
+        count = res.count or 0
+        _unread_counts.set(key, count)
+        return count
+    except Exception as e:
+        print(f"Error getting unread count: {e}")
+        return 0
 
 def send_direct_message(sender_id, receiver_id, message):
     """DMを送信"""
-    return {"error": "Not implemented"}
+    try:
+        from datetime import datetime
+
+        sender_id = str(sender_id)
+        receiver_id = str(receiver_id).strip()
+        message = (message or "").strip()
+
+        if not message:
+            return {"error": "メッセージを入力してください"}
+        if len(message) > DM_MAX_LENGTH:
+            return {"error": f"メッセージは{DM_MAX_LENGTH}文字以内で入力してください"}
+        if receiver_id == sender_id:
+            return {"error": "自分自身にはメッセージを送信できません"}
+        if not get_players([receiver_id]):
+            return {"error": "送信先のプレイヤーが見つかりません"}
+
+        res = supabase.table("direct_messages").insert({
+            "sender_id": sender_id,
+            "receiver_id": receiver_id,
+            "message": message,
+            "is_read": False,
+            "sender_deleted": False,
+            "receiver_deleted": False,
+            "created_at": datetime.utcnow().isoformat()
+        }).execute()
+
+        if not res.data:
+            return {"error": "メッセージの送信に失敗しました"}
+
+        sent = res.data[0]
+        _index_direct_message(sent)
+        dm_monitor_replay.append(sent["id"], sent)
+        notifications.publish(DM_MONITOR_TOPIC, "dm", sent)
+        notifications.publish(receiver_id, "dm", {
+            "id": sent.get("id"),
+            "sender_id": sender_id,
+            "created_at": sent.get("created_at")
+        })
+        _adjust_unread_count(receiver_id, 1)
+        return {"success": True, "message": sent}
+    except Exception as e:
+        print(f"Error sending direct message: {e}")
+        return {"error": "メッセージの送信に失敗しました"}
 
 def mark_message_as_read(message_id, user_id):
     """メッセージを既読にする"""
-    return {"error": "Not implemented"}
+    try:
+        # 未読の自分宛てメッセージだけを更新する (通常は1クエリで完了)
+        res = supabase.table("direct_messages").update({
+            "is_read": True
+        }).eq("id", message_id).eq("receiver_id", str(user_id)).eq("is_read", False).execute()
+
+        if res.data:
+            if not res.data[0].get("receiver_deleted"):
+                _adjust_unread_count(user_id, -1)
+            return {"success": True}
+
+        # 更新対象なし: 既読済みか、自分宛てではない
+        existing = supabase.table("direct_messages").select("id").eq(
+            "id", message_id
+        ).eq("receiver_id", str(user_id)).execute()
+        if not existing.data:
+            return {"error": "メッセージが見つかりません"}
+        return {"success": True}
+    except Exception as e:
+        print(f"Error marking message as read: {e}")
+        return {"error": "既読処理に失敗しました"}
 
 def delete_message_for_user(message_id, user_id):
-    """DMを削除"""
-    return {"error": "Not implemented"}
+    """DMを削除 (自分の側からだけ見えなくする)"""
+    try:
+        user_id = str(user_id)
+        res = supabase.table("direct_messages").select("*").eq("id", message_id).execute()
+        msg = res.data[0] if res.data else None
+
+        if not msg:
+            return {"error": "メッセージが見つかりません"}
+
+        if str(msg.get("receiver_id")) == user_id:
+            update = {"receiver_deleted": True}
+            was_unread = not msg.get("is_read") and not msg.get("receiver_deleted") and not msg.get("deleted_at")
+        elif str(msg.get("sender_id")) == user_id:
+            update = {"sender_deleted": True}
+            was_unread = False
+        else:
+            return {"error": "このメッセージを削除する権限がありません"}
 
-def get_active_trade_posts():
-    """有効な投稿を取得"""
-    return []
+        supabase.table("direct_messages").update(update).eq("id", message_id).execute()
+
+        if was_unread:
+            _adjust_unread_count(user_id, -1)
+        return {"success": True}
+    except Exception as e:
+        print(f"Error deleting message: {e}")
+        return {"error": "メッセージの削除に失敗しました"}
+
+# ==============================
+# エクスポート (管理者用)
+# ==============================
+
+def iter_table_rows(table, columns="*", key="id", date_column=None, date_from=None, date_to=None,
+                    chunk_size=1000, where=None):
+    """テーブルをキー列の昇順にチャンク取得して1行ずつ返す (メモリ使用量はチャンク分のみ)
+
+    date_from / date_to は date_column に対する ISO 形式の範囲 (date_to は含まない)。
+    where はクエリに追加の絞り込みを付ける関数 (query -> query)。
+    """
+    last_key = None
+    while True:
+        query = supabase.table(table).select(columns)
+        if where is not None:
+            query = where(query)
+        if date_column and date_from:
+            query = query.gte(date_column, date_from)
+        if date_column and date_to:
+            query = query.lt(date_column, date_to)
+        if last_key is not None:
+            query = query.gt(key, last_key)
+        res = query.order(key).limit(chunk_size).execute()
+        rows = res.data or []
+
+        yield from rows
+
+        if len(rows) < chunk_size:
+            return
+        last_key = rows[-1][key]
+
+# ==============================
+# 管理画面の集計
+# ==============================
+
+STATS_RECONCILE_CHUNK = 1000
+
+def _scan_players_for_stats():
+    """集計対象の列だけをプレイヤーID順にチャンク取得 (1チャンクずつ集計に渡す)"""
+    last_user_id = ""
+    while True:
+        res = supabase.table("players").select(
+            "user_id,gold,bot_banned,web_banned"
+        ).gt("user_id", last_user_id).order("user_id").limit(STATS_RECONCILE_CHUNK).execute()
+        rows = res.data or []
+        yield from rows
+        if len(rows) < STATS_RECONCILE_CHUNK:
+            return
+        last_user_id = rows[-1]["user_id"]
+
+def _scan_open_trades_for_stats():
+    """進行中のトレードをID順にチャンク取得 (max_rows で打ち切られないようにする)"""
+    last_id = 0
+    while True:
+        res = supabase.table("trades").select("id,status").in_(
+            "status", list(OPEN_TRADE_STATUSES)
+        ).gt("id", last_id).order("id").limit(STATS_RECONCILE_CHUNK).execute()
+        rows = res.data or []
+        yield from rows
+        if len(rows) < STATS_RECONCILE_CHUNK:
+            return
+        last_id = rows[-1]["id"]
+
+def reconcile_admin_stats():
+    """集計値をDBの内容で突き合わせ (チャンクごとに集計し、全行をまとめて保持しない)"""
+    try:
+        admin_stats.reconcile(_scan_players_for_stats(), _scan_open_trades_for_stats())
+        return True
+    except Exception as e:
+        print(f"Error reconciling admin stats: {e}")
+        return False
+
+# ==============================
+# BAN中ユーザーの集合
+# ==============================
+
+# 差分取得の重なり (アプリとDBの時計のずれ・同時刻の行の取りこぼし対策。反映は冪等)
+BAN_REFRESH_OVERLAP = timedelta(minutes=5)
+
+def load_ban_registry():
+    """BAN中のプレイヤーを全件読み込む (起動時)"""
+    try:
+        started_at = datetime.utcnow()
+        # max_rows で打ち切られないよう、プレイヤーID順にチャンク取得する
+        players = iter_table_rows(
+            "players", "user_id,bot_banned,web_banned", key="user_id",
+            where=lambda query: query.or_("bot_banned.eq.true,web_banned.eq.true")
+        )
+        ban_registry.load(players, watermark=started_at.isoformat())
+        return True
+    except Exception as e:
+        print(f"Error loading ban registry: {e}")
+        return False
+
+def refresh_ban_registry():
+    """前回以降にBAN・解除された ban_history の行だけを取り込む"""
+    if not ban_registry.loaded:
+        return load_ban_registry()
+    try:
+        since = (parse_timestamp(ban_registry.watermark) - BAN_REFRESH_OVERLAP).isoformat()
+        rows = iter_table_rows(
+            "ban_history", "id,user_id,ban_type,is_active,banned_at,unbanned_at",
+            where=lambda query: query.or_(f"banned_at.gte.{since},unbanned_at.gte.{since}")
+        )
+        ban_registry.apply_history(rows)
+        return True
+    except Exception as e:
+        print(f"Error refreshing ban registry: {e}")
+        return False
+
+# ==============================
+# DM監視 (管理者用)
+# ==============================
+
+# 監視画面へのライブ配信トピックと再接続用の直近メッセージ
+DM_MONITOR_TOPIC = "admin:dm-monitor"
+dm_monitor_replay = ReplayBuffer(maxlen=500)
+
+def get_recent_messages(limit=100, user_id=None, keyword=None):
+    """全ユーザーのDMを新しい順に取得 (ユーザー・キーワードで絞り込み可)"""
+    try:
+        query = supabase.table("direct_messages").select("*")
+        if user_id:
+            query = query.or_(f"sender_id.eq.{user_id},receiver_id.eq.{user_id}")
+        if keyword:
+            query = query.ilike("message", f"%{keyword}%")
+        res = query.order("id", desc=True).limit(limit).execute()
+        return res.data if res.data else []
+    except Exception as e:
+        print(f"Error getting recent messages: {e}")
+        return []
+
+def get_messages_after(cursor, limit=500, user_id=None, keyword=None, filter_fn=None):
+    """指定IDより後のDMのうち条件に合う最新 limit 件を古い順に取得 (監視フィードの再接続用)
+
+    絞り込みは件数制限の前に行う。cursor の直後から欠けなくリングバッファに残っていれば
+    クエリを発行しない (BOT側で挿入されたDMがあれば欠番になるのでDBから取得する)。
+    """
+    if dm_monitor_replay.covers(cursor):
+        messages = [msg for _, msg in dm_monitor_replay.since(cursor)]
+    else:
+        try:
+            query = supabase.table("direct_messages").select("*").gt("id", cursor)
+            if user_id:
+                query = query.or_(f"sender_id.eq.{user_id},receiver_id.eq.{user_id}")
+            if keyword:
+                query = query.ilike("message", f"%{keyword}%")
+            res = query.order("id", desc=True).limit(limit).execute()
+            messages = list(reversed(res.data or []))
+        except Exception as e:
+            print(f"Error getting messages after {cursor}: {e}")
+            return []
+
+    if filter_fn is not None:
+        messages = [msg for msg in messages if filter_fn(msg)]
+    return messages[-limit:]
+
+# ==============================
+# DM検索 (管理者用)
+# ==============================
+
+# DM本文のバイグラム検索インデックス
+_dm_search_index = NgramIndex()
+_dm_search_index_synced_at = None
+
+DM_SEARCH_SYNC_INTERVAL = 30
+DM_SEARCH_LOAD_CHUNK = 1000
+
+def _index_direct_message(msg):
+    """DMを検索インデックスに登録 (インデックス構築前は何もしない)"""
+    if not _dm_search_index.loaded or msg.get("id") is None:
+        return
+    _dm_search_index.add(
+        msg["id"],
+        msg.get("message"),
+        sender_id=str(msg.get("sender_id")),
+        receiver_id=str(msg.get("receiver_id")),
+        created_at=parse_timestamp(msg.get("created_at"))
+    )
+
+def _load_direct_messages_after(last_id):
+    """指定IDより新しいDMをID順にチャンク取得してインデックスに登録"""
+    while True:
+        res = supabase.table("direct_messages").select(
+            "id,sender_id,receiver_id,message,created_at"
+        ).gt("id", last_id).order("id").limit(DM_SEARCH_LOAD_CHUNK).execute()
+        rows = res.data or []
+        for msg in rows:
+            _index_direct_message(msg)
+        if len(rows) < DM_SEARCH_LOAD_CHUNK:
+            return
+        last_id = rows[-1]["id"]
+
+def load_dm_search_index():
+    """DM検索インデックスを構築"""
+    global _dm_search_index_synced_at
+    from datetime import datetime
+
+    try:
+        started_at = datetime.utcnow()
+        _dm_search_index.clear()
+        _dm_search_index.loaded = True
+        _load_direct_messages_after(0)
+        _dm_search_index_synced_at = started_at
+        return True
+    except Exception as e:
+        _dm_search_index.clear()
+        print(f"Error loading DM search index: {e}")
+        return False
+
+def _ensure_dm_search_index():
+    """未構築なら構築し、同期間隔を過ぎていれば新着分だけ取り込む"""
+    global _dm_search_index_synced_at
+    from datetime import datetime
+
+    if not _dm_search_index.loaded:
+        return load_dm_search_index()
+
+    now = datetime.utcnow()
+    if (now - _dm_search_index_synced_at).total_seconds() >= DM_SEARCH_SYNC_INTERVAL:
+        try:
+            _load_direct_messages_after(_dm_search_index.max_id)
+            _dm_search_index_synced_at = now
+        except Exception as e:
+            print(f"Error syncing DM search index: {e}")
+    return True
+
+def search_direct_messages(keyword, sender_id=None, receiver_id=None, date_from=None, date_to=None,
+                           before_id=None, limit=50):
+    """DM本文をキーワード検索 (送信者/受信者/日付で絞り込み、新しい順にページング)
+
+    date_from / date_to は "YYYY-MM-DD" 形式 (両端を含む)。
+    """
+    from datetime import timedelta
+
+    start = parse_timestamp(date_from) if date_from else None
+    end = parse_timestamp(date_to) + timedelta(days=1) if date_to and parse_timestamp(date_to) else None
+    sender_id = str(sender_id) if sender_id else None
+    receiver_id = str(receiver_id) if receiver_id else None
+
+    try:
+        if _ensure_dm_search_index():
+            def matches(fields):
+                if sender_id and fields["sender_id"] != sender_id:
+                    return False
+                if receiver_id and fields["receiver_id"] != receiver_id:
+                    return False
+                created_at = fields["created_at"]
+                if start and (created_at is None or created_at < start):
+                    return False
+                if end and (created_at is None or created_at >= end):
+                    return False
+                return True
+
+            ids = _dm_search_index.search(keyword, matches)
+            total = len(ids)
+            if before_id is not None:
+                ids = [msg_id for msg_id in ids if msg_id < before_id]
+            page_ids = ids[:limit]
+            next_cursor = page_ids[-1] if len(ids) > limit else None
+
+            # 状態 (削除・フラグ) は最新の行をまとめて取得して表示する
+            messages = []
+            if page_ids:
+                res = supabase.table("direct_messages").select("*").in_("id", page_ids).execute()
+                rows = {row["id"]: row for row in res.data or []}
+                messages = [rows[msg_id] for msg_id in page_ids if msg_id in rows]
+
+            return {"messages": messages, "total": total, "next_cursor": next_cursor}
+
+        # インデックスが使えない場合はDBの部分一致検索
+        query = supabase.table("direct_messages").select("*").ilike("message", f"%{keyword}%")
+        if sender_id:
+            query = query.eq("sender_id", sender_id)
+        if receiver_id:
+            query = query.eq("receiver_id", receiver_id)
+        if start:
+            query = query.gte("created_at", start.isoformat())
+        if end:
+            query = query.lt("created_at", end.isoformat())
+        if before_id is not None:
+            query = query.lt("id", before_id)
+        res = query.order("id", desc=True).limit(limit + 1).execute()
+        rows = res.data or []
+        next_cursor = rows[limit - 1]["id"] if len(rows) > limit else None
+        return {"messages": rows[:limit], "total": None, "next_cursor": next_cursor}
+    except Exception as e:
+        print(f"Error searching direct messages: {e}")
+        return {"messages": [], "total": 0, "next_cursor": None}
+
+# ==============================
+# トレード掲示板
+# ==============================
+
+# 投稿の有効期間 (expires_at が無い古い投稿は created_at からこの期間で期限切れ)
+# expires_at 列は migrations/002_trade_posts_expires_at.sql で追加する
+TRADE_POST_TTL = timedelta(days=7)
+
+def _trade_post_expiry_filter(now, live=True):
+    """DB問い合わせ用の期限条件 (or_ 形式)。索引と同じく expires_at が無い投稿は created_at + TRADE_POST_TTL で判定"""
+    cutoff = (now - TRADE_POST_TTL).isoformat()
+    op = "gt" if live else "lt"
+    return f"expires_at.{op}.{now.isoformat()},and(expires_at.is.null,created_at.{op}.{cutoff})"
+
+# 有効な投稿のインメモリ索引 (アイテム名/投稿者 -> 投稿ID)
+_trade_post_index = TradePostIndex(default_ttl=TRADE_POST_TTL)
+# 索引が使えない場合の直接問い合わせの結果 (DB障害時に古いデータとして返す)
+_trade_post_query_cache = TTLCache(maxsize=256, ttl=30, stale_ttl=600)
+_trade_post_index_synced_at = None
+
+# DBとの差分同期の間隔 (秒)
+TRADE_POST_SYNC_INTERVAL = 30
+TRADE_POST_LOAD_CHUNK = 1000
+
+# 期限切れ投稿の削除を1回のUPDATEで処理する件数
+TRADE_POST_PURGE_CHUNK = 200
+
+# 期限切れ投稿の削除件数 (起動後の累計)
+trade_post_purge_stats = {
+    "purged": 0,
+    "runs": 0,
+    "errors": 0,
+    "last_run_at": None
+}
+metrics.registry.callback_gauge(
+    "trade_post_purge", "期限切れ投稿の削除状況 (起動後の累計)", ("kind",),
+    lambda: [((kind,), trade_post_purge_stats[kind]) for kind in ("purged", "runs", "errors")]
+)
+
+def load_trade_post_index():
+    """有効な投稿をID順にチャンク取得して索引を構築"""
+    global _trade_post_index_synced_at
+    from datetime import datetime
+
+    try:
+        started_at = datetime.utcnow()
+        _trade_post_index.clear()
+        last_id = 0
+        while True:
+            res = supabase.table("trade_posts").select("*").is_(
+                "deleted_at", "null"
+            ).gt("id", last_id).order("id").limit(TRADE_POST_LOAD_CHUNK).execute()
+            rows = res.data or []
+            for post in rows:
+                _trade_post_index.add(post)
+            if len(rows) < TRADE_POST_LOAD_CHUNK:
+                break
+            last_id = rows[-1]["id"]
+
+        _trade_post_index.loaded = True
+        _trade_post_index_synced_at = started_at
+        return True
+    except Exception as e:
+        print(f"Error loading trade post index: {e}")
+        return False
+
+def sync_trade_post_index():
+    """前回同期以降の新規投稿・削除された投稿だけを索引に反映"""
+    global _trade_post_index_synced_at
+    from datetime import datetime, timedelta
+
+    if not _trade_post_index.loaded:
+        return load_trade_post_index()
+
+    try:
+        started_at = datetime.utcnow()
+        # 時計のずれを考慮して少し前から取得する
+        since = (_trade_post_index_synced_at - timedelta(seconds=5)).isoformat()
+        delta = f"id.gt.{_trade_post_index.max_id},deleted_at.gte.{since}"
+        # 長い障害の後や一括削除の後でも max_rows で打ち切られないよう、ID順にチャンク取得する
+        posts = iter_table_rows("trade_posts", where=lambda query: query.or_(delta))
+
+        for post in posts:
+            if post.get("deleted_at"):
+                _trade_post_index.remove(post["id"])
+            else:
+                _trade_post_index.add(post)
+
+        _trade_post_index_synced_at = started_at
+        return True
+    except Exception as e:
+        print(f"Error syncing trade post index: {e}")
+        return False
+
+def _ensure_trade_post_index():
+    """索引が未構築・同期間隔を過ぎている場合に同期 (成功すればTrue)"""
+    from datetime import datetime
+
+    if not _trade_post_index.loaded:
+        return load_trade_post_index()
+
+    elapsed = (datetime.utcnow() - _trade_post_index_synced_at).total_seconds()
+    if elapsed >= TRADE_POST_SYNC_INTERVAL:
+        # 同期できない間は前回同期時点の索引で応答する
+        if supabase_breaker.degraded or not sync_trade_post_index():
+            mark_stale("trade_posts")
+    return True
+
+def get_active_trade_posts(limit=None, before_id=None, offering=None, wanting=None, poster=None):
+    """有効な投稿を新しい順に取得
+
+    before_id を指定するとそのIDより古い投稿を返す (キーセットページング)。
+    offering / wanting はアイテム名、poster は投稿者IDで絞り込む。
+    """
+    if _ensure_trade_post_index():
+        return _trade_post_index.search(
+            offering=offering,
+            wanting=wanting,
+            poster=poster,
+            before_id=before_id,
+            limit=limit
+        )
+
+    # 索引が使えない場合はDBに直接問い合わせる (結果は障害時用に保持)
+    cache_key = (limit, before_id, offering, wanting, poster)
+    try:
+        from datetime import datetime
+        query = supabase.table("trade_posts").select("*").is_("deleted_at", "null").or_(
+            _trade_post_expiry_filter(datetime.utcnow())
+        )
+        if offering:
+            query = query.contains("offering_items", [offering])
+        if wanting:
+            query = query.ilike("wanting_items", f"%{wanting}%")
+        if poster:
+            query = query.eq("user_id", str(poster))
+        if before_id is not None:
+            query = query.lt("id", before_id)
+        query = query.order("id", desc=True)
+        if limit is not None:
+            query = query.limit(limit)
+        res = query.execute()
+        posts = res.data if res.data else []
+        _trade_post_query_cache.set(cache_key, posts)
+        return posts
+    except Exception as e:
+        posts = _trade_post_query_cache.get_stale(cache_key)
+        if posts is not None:
+            mark_stale("trade_posts")
+            return posts
+        print(f"Error getting active trade posts: {e}")
+        return []
+
+def find_trade_post_matches(user_id, wishlist=None, limit=20):
+    """所持アイテムを希望している投稿を一致数順に取得 (wishlist で提供アイテムも絞り込み)"""
+    if not _ensure_trade_post_index():
+        return []
+
+    inventory = get_available_inventory(user_id)
+    return _trade_post_index.match(
+        inventory,
+        wishlist,
+        exclude_user=user_id,
+        limit=limit
+    )
 
 def get_my_trade_posts(user_id):
     """自分の投稿を取得"""
-    return []
+    return get_active_trade_posts(poster=user_id)
 
 def create_trade_post(user_id, title, offering_items, wanting_items, message):
     """トレード募集を投稿"""
-    return {"error": "Not implemented"}
+    try:
+        from datetime import datetime
+
+        title = (title or "").strip()
+        offering_items = split_item_names(offering_items)
+        if not title:
+            return {"error": "タイトルを入力してください"}
+        if not offering_items:
+            return {"error": "提供するアイテムを選択してください"}
+        if not split_item_names(wanting_items):
+            return {"error": "希望するアイテムを入力してください"}
+
+        inventory = get_available_inventory(user_id)
+        for item in offering_items:
+            if item not in inventory:
+                return {"error": f"アイテム '{item}' を所持していません"}
+
+        created_at = datetime.utcnow()
+        res = supabase.table("trade_posts").insert({
+            "user_id": str(user_id),
+            "title": title,
+            "offering_items": offering_items,
+            "wanting_items": wanting_items.strip(),
+            "message": (message or "").strip(),
+            "created_at": created_at.isoformat(),
+            "expires_at": (created_at + TRADE_POST_TTL).isoformat()
+        }).execute()
+
+        if not res.data:
+            return {"error": "投稿に失敗しました"}
+
+        post = res.data[0]
+        if _trade_post_index.loaded:
+            _trade_post_index.add(post)
+        return {"success": True, "post": post}
+    except Exception as e:
+        print(f"Error creating trade post: {e}")
+        return {"error": "投稿に失敗しました"}
 
 def delete_trade_post(post_id, user_id):
-    """投稿を削除"""
-    return {"error": "Not implemented"}
+    """投稿を削除 (論理削除)"""
+    try:
+        from datetime import datetime
 
-def cleanup_expired_trade_posts():
-    """期限切れのトレード投稿をクリーンアップ"""
-    return True
+        post = _trade_post_index.get(post_id)
+        if post is None:
+            res = supabase.table("trade_posts").select("*").eq("id", post_id).is_(
+                "deleted_at", "null"
+            ).execute()
+            post = res.data[0] if res.data else None
+
+        if not post:
+            return {"error": "投稿が見つかりません"}
+        if str(post.get("user_id")) != str(user_id):
+            return {"error": "この投稿を削除する権限がありません"}
+
+        supabase.table("trade_posts").update({
+            "deleted_at": datetime.utcnow().isoformat(),
+            "deleted_by": str(user_id)
+        }).eq("id", post_id).execute()
+
+        _trade_post_index.remove(post_id)
+        return {"success": True}
+    except Exception as e:
+        print(f"Error deleting trade post: {e}")
+        return {"error": "投稿の削除に失敗しました"}
+
+def _purge_trade_posts(post_ids, deleted_at):
+    """投稿をまとめて論理削除"""
+    supabase.table("trade_posts").update({
+        "deleted_at": deleted_at
+    }).in_("id", post_ids).is_("deleted_at", "null").execute()
+
+def cleanup_expired_trade_posts(max_chunks=None):
+    """期限切れのトレード投稿をクリーンアップ
+
+    読み取り側は期限で絞り込むため、ここでは期限順の索引から
+    TRADE_POST_PURGE_CHUNK 件ずつ論理削除するだけでよい。
+    """
+    from datetime import datetime
+
+    now = datetime.utcnow()
+    deleted_at = now.isoformat()
+    trade_post_purge_stats["runs"] += 1
+    trade_post_purge_stats["last_run_at"] = deleted_at
+    chunks = 0
+
+    try:
+        while max_chunks is None or chunks < max_chunks:
+            if _trade_post_index.loaded:
+                expired = _trade_post_index.pop_expired(now, limit=TRADE_POST_PURGE_CHUNK)
+                post_ids = [post["id"] for post in expired]
+            else:
+                # 索引が無い場合はDBから期限切れのIDだけを取得する
+                expired = []
+                res = supabase.table("trade_posts").select("id").is_(
+                    "deleted_at", "null"
+                ).or_(_trade_post_expiry_filter(now, live=False)).order("id").limit(TRADE_POST_PURGE_CHUNK).execute()
+                post_ids = [row["id"] for row in res.data or []]
+
+            if not post_ids:
+                break
+
+            try:
+                _purge_trade_posts(post_ids, deleted_at)
+            except Exception:
+                # 次回の実行で再試行できるよう索引に戻す (期限切れなので表示はされない)
+                for post in expired:
+                    _trade_post_index.add(post)
+                raise
+
+            trade_post_purge_stats["purged"] += len(post_ids)
+            chunks += 1
+            if len(post_ids) < TRADE_POST_PURGE_CHUNK:
+                break
+
+        return True
+    except Exception as e:
+        trade_post_purge_stats["errors"] += 1
+        print(f"Error cleaning up expired trade posts: {e}")
+        return False
@@ -0,0 +1,29 @@
+"""CompressionMiddleware と計測ミドルウェアの組み合わせ"""
+import os
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.chdir(ROOT)
+os.environ.setdefault("SESSION_SECRET", "test-secret")
+
+from fastapi.testclient import TestClient
+
+import main
+from utils import metrics
+
+
+def test_304_keeps_route_label():
+    """圧縮用の ETag で条件付きGETしても 304 がルート名で記録される"""
+    client = TestClient(main.app)
+    first = client.get("/terms", headers={"Accept-Encoding": "br, gzip"})
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+
+    second = client.get("/terms", headers={"Accept-Encoding": "br, gzip", "If-None-Match": etag})
+    assert second.status_code == 304
+
+    rendered = metrics.registry.render()
+    assert 'http_requests_total{method="GET",route="/terms",status="304"}' in rendered
+    assert 'route="unmatched",status="304"' not in rendered
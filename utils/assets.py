@@ -0,0 +1,168 @@
+"""静的アセット (CSS) のビルドと配信
+
+static/css の各ファイルをバンドル・圧縮 (minify) し、内容のハッシュを含むファイル名で
+static/dist に出力する。gzip / brotli の圧縮済みファイルとマニフェストも同時に作る。
+
+    python -m utils.assets    # ビルド (起動時にも未ビルド・変更ありなら自動で実行する)
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+from pathlib import Path
+from markupsafe import Markup
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import StaticFiles, NotModifiedResponse
+
+try:
+    import brotli
+except ImportError:  # brotli が無い環境では gzip のみ作る
+    brotli = None
+
+STATIC_DIR = Path("static")
+CSS_DIR = STATIC_DIR / "css"
+DIST_DIR = STATIC_DIR / "dist"
+MANIFEST_PATH = DIST_DIR / "manifest.json"
+
+# バンドル名 -> 結合するファイル (テンプレートでの読み込み順)
+BUNDLES = {
+    "app.css": ["rpg-core.css", "rpg-components.css", "rpg-animations.css", "rpg-effects.css"],
+    "admin.css": ["rpg-core.css", "rpg-components.css", "rpg-animations.css", "rpg-effects.css", "admin-divine.css"],
+}
+
+# ハッシュ付きファイルのキャッシュ期間 (内容が変わればファイル名が変わる)
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+# ========================================
+# ビルド
+# ========================================
+
+def minify_css(css: str) -> str:
+    """コメントと余分な空白を取り除く (セレクタの意味が変わる空白は残す)"""
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{};,>])\s*", r"\1", css)
+    css = re.sub(r":\s+", ":", css)
+    css = css.replace(";}", "}")
+    return css.strip()
+
+
+def _sources_digest() -> str:
+    digest = hashlib.sha256()
+    for name in sorted({name for files in BUNDLES.values() for name in files}):
+        digest.update(name.encode())
+        digest.update((CSS_DIR / name).read_bytes())
+    return digest.hexdigest()
+
+
+def _write(path: Path, data: bytes):
+    path.write_bytes(data)
+    # 圧縮済みファイルを並べて置く (配信時に Accept-Encoding で選ぶ)
+    path.with_name(path.name + ".gz").write_bytes(gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        path.with_name(path.name + ".br").write_bytes(brotli.compress(data, quality=11))
+
+
+def build_assets() -> dict:
+    """バンドルを作成してマニフェストを返す"""
+    DIST_DIR.mkdir(parents=True, exist_ok=True)
+    files = {}
+    for bundle, sources in BUNDLES.items():
+        css = "\n".join((CSS_DIR / name).read_text(encoding="utf-8") for name in sources)
+        data = minify_css(css).encode("utf-8")
+        stem, ext = os.path.splitext(bundle)
+        filename = f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+        _write(DIST_DIR / filename, data)
+        files[bundle] = f"dist/{filename}"
+
+    manifest = {"sources": _sources_digest(), "files": files}
+
+    # 古いハッシュのファイルを削除
+    current = {Path(path).name for path in files.values()}
+    for path in DIST_DIR.iterdir():
+        base = path.name.removesuffix(".gz").removesuffix(".br")
+        if path != MANIFEST_PATH and base not in current:
+            path.unlink()
+
+    MANIFEST_PATH.write_text(json.dumps(manifest, indent=2) + "\n", encoding="utf-8")
+    return manifest
+
+
+_manifest = None
+
+
+def load_manifest(rebuild_if_stale: bool = True) -> dict:
+    """マニフェストを読み込む (未ビルド・ソース変更時は再ビルド)"""
+    global _manifest
+    try:
+        manifest = json.loads(MANIFEST_PATH.read_text(encoding="utf-8"))
+        if rebuild_if_stale and manifest.get("sources") != _sources_digest():
+            manifest = build_assets()
+    except FileNotFoundError:
+        manifest = build_assets() if rebuild_if_stale else {}
+    except Exception as e:
+        print(f"⚠️ アセットのマニフェストを読み込めません: {e}")
+        manifest = {}
+    _manifest = manifest
+    return manifest
+
+
+def stylesheets(bundle: str = "app.css") -> Markup:
+    """テンプレート用: バンドルの <link> タグ (未ビルドなら個別ファイルを読み込む)"""
+    manifest = _manifest if _manifest is not None else load_manifest()
+    path = manifest.get("files", {}).get(bundle)
+    if path:
+        hrefs = [f"/static/{path}"]
+    else:
+        hrefs = [f"/static/css/{name}" for name in BUNDLES.get(bundle, [])]
+    return Markup("\n    ".join(f'<link href="{href}" rel="stylesheet">' for href in hrefs))
+
+
+# ========================================
+# 配信
+# ========================================
+
+class AssetStaticFiles(StaticFiles):
+    """圧縮済みファイルの選択と、ハッシュ付きファイルへの長期キャッシュ指定を行う StaticFiles"""
+
+    ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        request_headers = Headers(scope=scope)
+        immutable = f"{os.sep}dist{os.sep}" in str(full_path)
+
+        accepted = {
+            value.split(";")[0].strip()
+            for value in request_headers.get("accept-encoding", "").split(",")
+        }
+        for encoding, suffix in self.ENCODINGS:
+            compressed = f"{full_path}{suffix}"
+            if encoding in accepted and os.path.isfile(compressed):
+                response = FileResponse(
+                    compressed,
+                    status_code=status_code,
+                    stat_result=os.stat(compressed),
+                    media_type=mimetypes.guess_type(str(full_path))[0] or "text/plain"
+                )
+                response.headers["Content-Encoding"] = encoding
+                break
+        else:
+            response = FileResponse(full_path, status_code=status_code, stat_result=stat_result)
+
+        response.headers["Vary"] = "Accept-Encoding"
+        if immutable:
+            response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+if __name__ == "__main__":
+    result = build_assets()
+    for bundle, path in result["files"].items():
+        size = (STATIC_DIR / path).stat().st_size
+        print(f"✅ {bundle} -> static/{path} ({size:,} bytes)")
@@ -1,34 +1,88 @@
 from fastapi import Request, HTTPException
 from jose import jwt, JWTError
+import hashlib
 import os
+import time
+from utils import metrics
+from utils.bans import ban_registry, rejected as banned_rejected
+from utils.cache import TTLCache
 
 SECRET_KEY = os.getenv("SESSION_SECRET")
+ALGORITHM = "HS256"
 
 if not SECRET_KEY:
     raise ValueError("SESSION_SECRETの環境変数を設定してください。セキュリティ上、デフォルト値は使用できません。")
 
-def get_current_user(request: Request):
-    """認証済みユーザーのDiscord IDを取得"""
-    token = request.cookies.get("session_token")
+# 検証済みトークンのキャッシュ (トークンのハッシュ -> (Discord ID, 有効期限))
+# 有効期限 (exp) を過ぎたものは使わない。検証に失敗したトークンは保持しない。
+_verified_tokens = TTLCache(maxsize=10000, ttl=600)
+metrics.register_cache("sessions", _verified_tokens)
+
+
+def _token_key(token: str) -> bytes:
+    return hashlib.sha256(token.encode("utf-8")).digest()
 
-    if not token:
-        raise HTTPException(status_code=401, detail="ログインが必要です")
+
+def verify_session_token(token: str) -> str:
+    """session_token を検証してDiscord IDを返す (失敗時は 401、Web利用禁止中は 403)"""
+    key = _token_key(token)
+    cached = _verified_tokens.get(key)
+    if cached is not None:
+        discord_id, expires_at = cached
+        if expires_at is None or time.time() < expires_at:
+            return reject_if_banned(discord_id)
+        _verified_tokens.delete(key)
 
     try:
         payload = jwt.decode(
-            token, 
-            SECRET_KEY, 
-            algorithms=["HS256"],
+            token,
+            SECRET_KEY,
+            algorithms=[ALGORITHM],
             options={"verify_exp": True}
         )
-        discord_id: str = payload.get("discord_id")
-
-        if not discord_id:
-            raise HTTPException(status_code=401, detail="無効なトークンです")
-
-        return discord_id
-
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="セッションの有効期限が切れました。再度ログインしてください")
     except JWTError:
-        raise HTTPException(status_code=401, detail="トークンの検証に失敗しました")
\ No newline at end of file
+        raise HTTPException(status_code=401, detail="トークンの検証に失敗しました")
+
+    discord_id = payload.get("discord_id")
+    if not discord_id:
+        raise HTTPException(status_code=401, detail="無効なトークンです")
+    discord_id = str(discord_id)
+
+    expires_at = payload.get("exp")
+    ttl = None
+    if expires_at is not None:
+        expires_at = float(expires_at)
+        ttl = min(_verified_tokens.ttl, expires_at - time.time())
+    if ttl is None or ttl > 0:
+        _verified_tokens.set(key, (discord_id, expires_at), ttl=ttl)
+    return reject_if_banned(discord_id)
+
+
+def reject_if_banned(discord_id: str) -> str:
+    """Web利用禁止中のユーザーを拒否 (メモリ上の集合を見るだけでDBには問い合わせない)"""
+    if ban_registry.is_banned(discord_id, "web"):
+        banned_rejected.inc()
+        raise HTTPException(status_code=403, detail="このアカウントはWeb利用が禁止されています")
+    return discord_id
+
+
+def session_discord_id(token: str = None):
+    """session_token からDiscord IDを取得 (未ログイン・検証失敗時は None)"""
+    if not token:
+        return None
+    try:
+        return verify_session_token(token)
+    except HTTPException:
+        return None
+
+
+def get_current_user(request: Request):
+    """認証済みユーザーのDiscord IDを取得"""
+    token = request.cookies.get("session_token")
+
+    if not token:
+        raise HTTPException(status_code=401, detail="ログインが必要です")
+
+    return verify_session_token(token)
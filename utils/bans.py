@@ -0,0 +1,80 @@
+import threading
+from utils import metrics
+from utils.trade_post_index import parse_timestamp
+
+BAN_TYPES = ("bot", "web")
+
+
+class BanRegistry:
+    """BAN中のユーザーの集合 (BAN種別ごと)
+
+    起動時に players から全件読み込み、その後は管理画面の操作で即時に、
+    ban_history の差分 (banned_at / unbanned_at が前回以降の行) で定期的に更新する。
+    リクエストごとの確認は集合の参照だけで済む。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._banned = {ban_type: frozenset() for ban_type in BAN_TYPES}
+        self.loaded = False
+        # 差分取得の基準 (取り込んだ ban_history の最新の日時、UTCのISO形式)
+        self.watermark = None
+
+    def is_banned(self, user_id, ban_type: str = "web") -> bool:
+        return str(user_id) in self._banned[ban_type]
+
+    def count(self, ban_type: str) -> int:
+        return len(self._banned[ban_type])
+
+    def set(self, user_id, ban_type: str, banned: bool):
+        """1件のBAN/解除を反映 (読み取り側はロックなしで参照できるよう集合ごと差し替える)"""
+        key = str(user_id)
+        with self._lock:
+            current = self._banned[ban_type]
+            if banned and key not in current:
+                self._banned[ban_type] = current | {key}
+            elif not banned and key in current:
+                self._banned[ban_type] = current - {key}
+
+    def load(self, players, watermark=None):
+        """players の行 (user_id, bot_banned, web_banned) から全件を作り直す"""
+        banned = {ban_type: set() for ban_type in BAN_TYPES}
+        for player in players:
+            for ban_type in BAN_TYPES:
+                if player.get(f"{ban_type}_banned"):
+                    banned[ban_type].add(str(player["user_id"]))
+        with self._lock:
+            self._banned = {ban_type: frozenset(ids) for ban_type, ids in banned.items()}
+            self.watermark = watermark
+            self.loaded = True
+
+    @staticmethod
+    def _event_time(row: dict):
+        """行の最後の変化 (解除済みなら解除日時、BAN中ならBAN日時)"""
+        return row.get("banned_at") if row.get("is_active") else (row.get("unbanned_at") or row.get("banned_at"))
+
+    def apply_history(self, rows) -> int:
+        """ban_history の差分を古い順に反映し、反映した件数を返す"""
+        events = [
+            row for row in rows
+            if row.get("ban_type") in BAN_TYPES and row.get("user_id") and self._event_time(row)
+        ]
+        events.sort(key=lambda row: parse_timestamp(self._event_time(row)))
+        for row in events:
+            self.set(row["user_id"], row["ban_type"], bool(row.get("is_active")))
+        if events:
+            latest = parse_timestamp(self._event_time(events[-1]))
+            if self.watermark is None or latest > parse_timestamp(self.watermark):
+                self.watermark = latest.isoformat()
+        return len(events)
+
+
+ban_registry = BanRegistry()
+
+rejected = metrics.registry.counter(
+    "banned_requests_total", "BAN中のユーザーとして拒否したリクエスト数"
+)
+metrics.registry.callback_gauge(
+    "banned_users", "BAN中のユーザー数", ("ban_type",),
+    lambda: [((ban_type,), ban_registry.count(ban_type)) for ban_type in BAN_TYPES]
+)
@@ -0,0 +1,82 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """有効期限と最大件数付きのインメモリキャッシュ (LRU方式で追い出し)
+
+    stale_ttl を指定すると、期限切れ後もその秒数だけ値を残し、get_stale() で取り出せる
+    (バックエンド障害時に古いデータで応答するため)。
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 30.0, stale_ttl: float = 0.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """キーの値を取得 (期限切れ・未登録の場合は default)"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            value, expires_at = entry
+            now = time.monotonic()
+            if expires_at < now:
+                if expires_at + self.stale_ttl < now:
+                    del self._data[key]
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def get_stale(self, key, default=None):
+        """期限切れでも stale_ttl 以内なら値を返す (ヒット率の集計には含めない)"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at + self.stale_ttl < time.monotonic():
+                return default
+            return value
+
+    def get_many(self, keys) -> dict:
+        """複数キーをまとめて取得 (見つかったものだけを返す)"""
+        found = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                found[key] = value
+        return found
+
+    def set(self, key, value, ttl: float = None):
+        """値を登録"""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        """値を削除"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """全件削除"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
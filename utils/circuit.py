@@ -0,0 +1,149 @@
+import os
+import threading
+import time
+from contextvars import ContextVar
+from utils import metrics
+
+# 連続でこの回数失敗したら遮断する
+FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+# 遮断してから試行 (半開) に移るまでの秒数
+RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+# 成功してもこれより遅い呼び出しは失敗として数える (秒)
+SLOW_CALL_THRESHOLD = float(os.getenv("CIRCUIT_SLOW_CALL", "5"))
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """遮断中のため呼び出しを行わなかった"""
+
+
+class CircuitBreaker:
+    """連続した失敗・タイムアウトで呼び出しを遮断し、一定時間後に1件ずつ試行する
+
+    closed: 通常どおり呼び出す
+    open: 呼び出さずに CircuitOpenError (待ち時間なしで失敗)
+    half_open: 試行の1件だけを通し、成功すれば closed、失敗すれば再び open
+    """
+
+    def __init__(self, name: str, failure_threshold: int = FAILURE_THRESHOLD,
+                 reset_timeout: float = RESET_TIMEOUT, slow_call: float = SLOW_CALL_THRESHOLD):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.slow_call = slow_call
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    @property
+    def degraded(self) -> bool:
+        return self.state != CLOSED
+
+    def before_call(self):
+        """呼び出し前の確認 (遮断中は CircuitOpenError)"""
+        if self.state == CLOSED:
+            return
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self._set_state(HALF_OPEN)
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+        rejected.inc(breaker=self.name)
+        raise CircuitOpenError(f"{self.name} は停止中のため呼び出しを省略しました")
+
+    def record_success(self, elapsed: float = 0.0):
+        if elapsed >= self.slow_call:
+            self.record_failure()
+            return
+        if self.state == CLOSED and not self.failures:
+            return
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+            if self.state != CLOSED:
+                print(f"✅ {self.name} が復旧しました")
+                self._set_state(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                if self.state == CLOSED:
+                    print(f"⚠️ {self.name} への呼び出しを遮断します (連続失敗 {self.failures}件)")
+                self.opened_at = time.monotonic()
+                self._set_state(OPEN)
+
+    def _set_state(self, state: str):
+        self.state = state
+        transitions.inc(breaker=self.name, state=state)
+
+
+transitions = metrics.registry.counter(
+    "circuit_transitions_total", "サーキットブレーカーの状態遷移数", ("breaker", "state")
+)
+rejected = metrics.registry.counter(
+    "circuit_rejected_total", "遮断中のため行わなかった呼び出し数", ("breaker",)
+)
+stale_served = metrics.registry.counter(
+    "stale_responses_total", "障害中にキャッシュの古いデータで応答した回数", ("source",)
+)
+
+
+def register_breaker(breaker: CircuitBreaker):
+    """状態を circuit_state (0=closed, 1=half_open, 2=open) として公開"""
+    metrics.registry.callback_gauge(
+        "circuit_state", "サーキットブレーカーの状態 (0=closed, 1=half_open, 2=open)", ("breaker",),
+        lambda: [((breaker.name,), STATE_VALUES[breaker.state])]
+    )
+
+
+# ========================================
+# 古いデータで応答したことの通知
+# ========================================
+
+_stale = ContextVar("stale_sources", default=None)
+
+
+def mark_stale(source: str):
+    """このリクエストでキャッシュの古いデータを使ったことを記録"""
+    stale_served.inc(source=source)
+    sources = _stale.get()
+    if sources is not None:
+        sources.add(source)
+
+
+class StaleDataMiddleware:
+    """古いデータを含むレスポンスに X-Data-Stale ヘッダーを付け、キャッシュさせない"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        sources = set()
+        token = _stale.set(sources)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and sources:
+                headers = [
+                    (name, value) for name, value in message.get("headers", [])
+                    if name.lower() not in (b"etag", b"last-modified", b"cache-control")
+                ]
+                headers.append((b"x-data-stale", ",".join(sorted(sources)).encode()))
+                headers.append((b"cache-control", b"no-store"))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _stale.reset(token)
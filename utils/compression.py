@@ -0,0 +1,246 @@
+import gzip
+import time
+import zlib
+from starlette.datastructures import Headers, MutableHeaders
+from utils import metrics
+from utils.cache import TTLCache
+
+try:
+    import brotli
+except ImportError:  # brotli が無い環境では gzip のみ
+    brotli = None
+
+# これより小さいレスポンスは圧縮しない (ヘッダー分で得をしない)
+MINIMUM_SIZE = 1024
+
+# 圧縮する Content-Type (画像・フォント・圧縮済み形式は対象外)
+COMPRESSIBLE_TYPES = (
+    "text/html", "text/css", "text/plain", "text/csv", "text/javascript",
+    "application/json", "application/javascript", "application/x-ndjson",
+    "application/xml", "image/svg+xml",
+)
+
+# 圧縮レベル: ETag付き (結果をキャッシュして使い回す) は高圧縮、その他は軽め
+CACHED_LEVELS = {"br": 11, "gzip": 9}
+DYNAMIC_LEVELS = {"br": 4, "gzip": 5}
+
+compression_cache = TTLCache(maxsize=256, ttl=3600)
+metrics.register_cache("compression", compression_cache)
+
+bytes_in = metrics.registry.counter(
+    "compression_input_bytes_total", "圧縮前のバイト数", ("encoding",)
+)
+bytes_out = metrics.registry.counter(
+    "compression_output_bytes_total", "圧縮後のバイト数", ("encoding",)
+)
+cpu_seconds = metrics.registry.counter(
+    "compression_cpu_seconds_total", "圧縮に使ったCPU時間", ("encoding",)
+)
+skipped = metrics.registry.counter(
+    "compression_skipped_total", "圧縮しなかったレスポンス数", ("reason",)
+)
+metrics.registry.callback_gauge(
+    "compression_ratio", "圧縮後/圧縮前のバイト数の比", ("encoding",),
+    lambda: [
+        ((encoding,), bytes_out.value(encoding=encoding) / bytes_in.value(encoding=encoding))
+        for encoding in ("br", "gzip") if bytes_in.value(encoding=encoding)
+    ]
+)
+
+
+def negotiate(accept_encoding: str):
+    """Accept-Encoding から使う形式を選ぶ (brotli を優先、q=0 は除外)"""
+    accepted = set()
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(name.strip().lower())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(data: bytes, encoding: str, level: int) -> bytes:
+    start = time.thread_time()
+    if encoding == "br":
+        result = brotli.compress(data, quality=level)
+    else:
+        result = gzip.compress(data, compresslevel=level, mtime=0)
+    cpu_seconds.inc(time.thread_time() - start, encoding=encoding)
+    bytes_in.inc(len(data), encoding=encoding)
+    bytes_out.inc(len(result), encoding=encoding)
+    return result
+
+
+class _StreamCompressor:
+    """分割して送られるレスポンス (CSVエクスポートなど) を逐次圧縮"""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        level = DYNAMIC_LEVELS[encoding]
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=level)
+        else:
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def _run(self, data: bytes, final: bool) -> bytes:
+        start = time.thread_time()
+        if self.encoding == "br":
+            result = self._compressor.process(data) if data else b""
+            result += self._compressor.finish() if final else self._compressor.flush()
+        else:
+            result = self._compressor.compress(data)
+            result += self._compressor.flush() if final else self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        cpu_seconds.inc(time.thread_time() - start, encoding=self.encoding)
+        bytes_in.inc(len(data), encoding=self.encoding)
+        bytes_out.inc(len(result), encoding=self.encoding)
+        return result
+
+    def chunk(self, data: bytes) -> bytes:
+        return self._run(data, final=False)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._run(data, final=True)
+
+
+def _tag_etag(etag: str, encoding: str) -> str:
+    """圧縮後の表現用に ETag を区別する ("abc" -> "abc-br")"""
+    if etag.endswith('"'):
+        return f'{etag[:-1]}-{encoding}"'
+    return etag
+
+
+def _untag_if_none_match(scope: dict):
+    """If-None-Match から圧縮用の接尾辞を外す (元の ETag と比較できるように)
+
+    scope はコピーせずにヘッダーだけを置き換える。ルーティングが書き込む scope["route"] を
+    外側のミドルウェア (メトリクス) からも見えるようにするため。
+    """
+    headers = scope["headers"]
+    for i, (name, value) in enumerate(headers):
+        if name == b"if-none-match":
+            untagged = value.replace(b'-br"', b'"').replace(b'-gzip"', b'"')
+            if untagged != value:
+                headers = list(headers)
+                headers[i] = (name, untagged)
+                scope["headers"] = headers
+            return
+
+
+class CompressionMiddleware:
+    """brotli / gzip によるレスポンス圧縮
+
+    - 小さいレスポンス・圧縮済み (Content-Encoding 付き)・対象外の形式・SSE は圧縮しない
+    - ETag 付きのレスポンス (描画キャッシュ・静的ファイル) は高圧縮で圧縮し、結果をキャッシュする
+    """
+
+    def __init__(self, app, minimum_size: int = MINIMUM_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(send, encoding, self.minimum_size, scope["method"] == "HEAD")
+        _untag_if_none_match(scope)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    def __init__(self, send, encoding, minimum_size, is_head):
+        self._send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.is_head = is_head
+        self.start = None
+        self.passthrough = False
+        self.stream = None
+
+    def _skip(self, reason: str) -> bool:
+        skipped.inc(reason=reason)
+        self.passthrough = True
+        return True
+
+    def _should_skip(self, headers) -> bool:
+        status = self.start["status"]
+        if status == 304:
+            # 圧縮版の ETag で問い合わせてきた場合は同じ ETag を返す (弱い ETag は圧縮時も変えない)
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                headers["ETag"] = _tag_etag(etag, self.encoding)
+            return self._skip("not_modified")
+        if status < 200 or status == 204 or self.is_head:
+            return self._skip("no_body")
+        if "content-encoding" in headers:
+            return self._skip("encoded")
+        content_type = headers.get("content-type", "").split(";")[0].strip().lower()
+        if not content_type.startswith(COMPRESSIBLE_TYPES):
+            return self._skip("content_type")
+        return False
+
+    async def send(self, message):
+        if message["type"] == "http.response.start":
+            self.start = message
+            headers = MutableHeaders(scope=message)
+            if self._should_skip(headers):
+                await self._send(message)
+            return
+
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        headers = MutableHeaders(scope=self.start)
+
+        if self.stream is None and not more_body:
+            await self._send_whole(headers, body)
+            return
+
+        if self.stream is None:
+            # 分割送信 (StreamingResponse・大きなファイル) は逐次圧縮する
+            self.stream = _StreamCompressor(self.encoding)
+            self._set_encoding_headers(headers)
+            del headers["content-length"]
+            await self._send(self.start)
+
+        data = self.stream.chunk(body) if more_body else self.stream.finish(body)
+        await self._send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+    async def _send_whole(self, headers, body):
+        if len(body) < self.minimum_size:
+            skipped.inc(reason="small")
+            await self._send(self.start)
+            await self._send({"type": "http.response.body", "body": body})
+            return
+
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            key = (etag, self.encoding)
+            compressed = compression_cache.get(key)
+            if compressed is None:
+                compressed = compress(body, self.encoding, CACHED_LEVELS[self.encoding])
+                compression_cache.set(key, compressed)
+            headers["ETag"] = _tag_etag(etag, self.encoding)
+        else:
+            compressed = compress(body, self.encoding, DYNAMIC_LEVELS[self.encoding])
+
+        self._set_encoding_headers(headers)
+        headers["Content-Length"] = str(len(compressed))
+        await self._send(self.start)
+        await self._send({"type": "http.response.body", "body": compressed})
+
+    def _set_encoding_headers(self, headers):
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
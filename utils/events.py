@@ -0,0 +1,149 @@
+import asyncio
+import threading
+from collections import defaultdict, deque
+from utils.responses import dumps
+
+
+def format_sse(event: str, data: dict, event_id=None) -> str:
+    """Server-Sent Events 形式に変換"""
+    payload = dumps(data).decode("utf-8")
+    prefix = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{prefix}event: {event}\ndata: {payload}\n\n"
+
+
+class Subscription:
+    """1接続分の購読 (上限付きバッファ)"""
+
+    def __init__(self, key: str, loop, buffer_size: int, filter_fn=None):
+        self.key = key
+        self.loop = loop
+        self.filter_fn = filter_fn
+        self.queue = asyncio.Queue(maxsize=buffer_size)
+        self.dropped = 0
+
+    def _put(self, item):
+        # バッファが溢れたら古いイベントから捨てる (遅いクライアントで詰まらせない)
+        while self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(item)
+
+    async def get(self, timeout: float = None):
+        """次のイベントを待つ (timeout 秒で None)"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class EventBroker:
+    """ユーザー (またはトピック) 単位のインプロセスPub/Sub (SSE配信用)
+
+    プロセス内でのみ配信されるため、ワーカー1プロセス構成を前提とする。
+    """
+
+    def __init__(self, max_connections: int = 500, max_per_user: int = 5, buffer_size: int = 50):
+        self.max_connections = max_connections
+        self.max_per_user = max_per_user
+        self.buffer_size = buffer_size
+        self._subscribers = defaultdict(set)
+        self._count = 0
+        self._lock = threading.Lock()
+        self.published = 0
+
+    @property
+    def connection_count(self) -> int:
+        return self._count
+
+    def subscribe(self, key, filter_fn=None) -> Subscription:
+        """購読を開始 (接続数の上限を超える場合は None)
+
+        filter_fn(data) が False を返すイベントはこの接続のバッファに入れない。
+        """
+        key = str(key)
+        with self._lock:
+            if self._count >= self.max_connections:
+                return None
+            if len(self._subscribers[key]) >= self.max_per_user:
+                return None
+            subscription = Subscription(key, asyncio.get_running_loop(), self.buffer_size, filter_fn)
+            self._subscribers[key].add(subscription)
+            self._count += 1
+            return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        """購読を終了"""
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.key)
+            if subscribers and subscription in subscribers:
+                subscribers.discard(subscription)
+                self._count -= 1
+                if not subscribers:
+                    del self._subscribers[subscription.key]
+
+    def publish(self, key, event: str, data: dict):
+        """キーの全接続にイベントを配信 (購読者がいなければ何もしない)"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(str(key), ()))
+        if not subscribers:
+            return
+
+        self.published += 1
+        item = (event, data)
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+
+        for subscription in subscribers:
+            if subscription.filter_fn is not None and not subscription.filter_fn(data):
+                continue
+            if running_loop is subscription.loop:
+                subscription._put(item)
+                continue
+            # スレッドプールなど別スレッドからの配信
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._put, item)
+            except RuntimeError:
+                # イベントループ終了済みの接続は無視する
+                pass
+
+
+class ReplayBuffer:
+    """再接続時の取りこぼしを埋めるための直近イベントのリングバッファ (IDは昇順)
+
+    このプロセスを経由しない書き込み (BOT側の挿入など) はバッファに入らないため、
+    cursor の直後から連番で揃っている場合だけバッファを使い、それ以外は呼び出し側でDBから補う。
+    """
+
+    def __init__(self, maxlen: int = 500):
+        self._items = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+
+    def append(self, event_id, data):
+        with self._lock:
+            self._items.append((event_id, data))
+
+    def covers(self, cursor) -> bool:
+        """cursor より後のイベントが欠けなくバッファにあるか
+
+        最新まで受信済みの cursor (バッファの最古以上・最新以上) は新着なしとして True。
+        それ以外は cursor+1 から連番で揃っている場合だけ True (欠番があればDBから補う)。
+        """
+        with self._lock:
+            if not self._items:
+                return False
+            oldest = self._items[0][0]
+            ids = [event_id for event_id, _ in self._items if event_id > cursor]
+        if not ids:
+            return cursor >= oldest
+        return ids == list(range(cursor + 1, cursor + 1 + len(ids)))
+
+    def since(self, cursor) -> list:
+        """cursor より後のイベントを古い順に返す"""
+        with self._lock:
+            return [(event_id, data) for event_id, data in self._items if event_id > cursor]
+
+
+# アプリ全体で共有する通知ブローカー
+notifications = EventBroker()
@@ -0,0 +1,266 @@
+import bisect
+import time
+from collections import defaultdict
+
+# レイテンシ用の既定バケット (秒)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labelnames, values, extra=None) -> str:
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in pairs
+    )
+    return "{" + body + "}"
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> list:
+        return []
+
+
+class Counter(_Metric):
+    """単調増加カウンター
+
+    ロックは取らない (GIL下の加算のみ)。スレッド間で極まれに1件取りこぼしうるが、
+    監視用途では許容してリクエスト経路のオーバーヘッドを優先する。
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self._values = defaultdict(float)
+
+    def inc(self, amount: float = 1, **labels):
+        self._values[self._key(labels)] += amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self):
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in list(self._values.items())
+        ]
+
+
+class Gauge(Counter):
+    """増減する値"""
+
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self._values[self._key(labels)] -= amount
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+
+class CallbackGauge(_Metric):
+    """出力時に関数から値を取得するゲージ (関数は (ラベル値タプル, 値) を返す)"""
+
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labelnames, fn):
+        super().__init__(name, help_text, labelnames)
+        self.fn = fn
+
+    def _samples(self):
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in self.fn()
+        ]
+
+
+class Histogram(_Metric):
+    """事前に区切ったバケットのヒストグラム (観測は二分探索1回と加算のみ)"""
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            # [バケットごとの件数..., +Inf の件数, 合計]
+            series = self._series.setdefault(key, [0] * (len(self.buckets) + 1) + [0.0])
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def time(self, **labels):
+        """with 文で処理時間を観測"""
+        return _Timer(self, labels)
+
+    def _samples(self):
+        lines = []
+        for key, series in list(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(float(bound))))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class Registry:
+    """メトリクスの登録先 (Prometheus テキスト形式で出力)"""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help_text, labelnames=()) -> Counter:
+        return self.register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name, help_text, labelnames=()) -> Gauge:
+        return self.register(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def callback_gauge(self, name, help_text, labelnames, fn) -> CallbackGauge:
+        return self.register(CallbackGauge(name, help_text, labelnames, fn))
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                lines.append(f"# {metric.name} の出力に失敗しました: {e}")
+        return "\n".join(lines) + "\n"
+
+
+# アプリ全体で共有するレジストリ
+registry = Registry()
+
+# ---- HTTP ----
+http_requests = registry.counter(
+    "http_requests_total", "HTTPリクエスト数", ("method", "route", "status")
+)
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds", "HTTPリクエストの処理時間", ("method", "route")
+)
+http_in_flight = registry.gauge(
+    "http_requests_in_flight", "処理中のHTTPリクエスト数"
+)
+rate_limited = registry.counter(
+    "rate_limited_total", "レート制限で拒否したリクエスト数"
+)
+
+# ---- Supabase ----
+backend_duration = registry.histogram(
+    "supabase_request_duration_seconds", "Supabaseへの問い合わせ時間", ("table", "operation")
+)
+backend_errors = registry.counter(
+    "supabase_errors_total", "Supabaseへの問い合わせエラー数", ("table", "operation")
+)
+
+# ---- キャッシュ ----
+_caches = {}
+
+
+def register_cache(name: str, cache):
+    """hits / misses 属性を持つキャッシュを監視対象に追加"""
+    _caches[name] = cache
+
+
+def _cache_values(attr):
+    return lambda: [((name,), getattr(cache, attr)) for name, cache in list(_caches.items())]
+
+
+def _cache_ratios():
+    ratios = []
+    for name, cache in list(_caches.items()):
+        total = cache.hits + cache.misses
+        ratios.append(((name,), cache.hits / total if total else 0.0))
+    return ratios
+
+
+registry.callback_gauge("cache_hits", "キャッシュヒット数 (起動後の累計)", ("cache",), _cache_values("hits"))
+registry.callback_gauge("cache_misses", "キャッシュミス数 (起動後の累計)", ("cache",), _cache_values("misses"))
+registry.callback_gauge("cache_hit_ratio", "キャッシュヒット率", ("cache",), _cache_ratios)
+
+
+class MetricsMiddleware:
+    """ルート別のリクエスト数・処理時間・同時実行数を記録する ASGI ミドルウェア"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        http_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_in_flight.dec()
+            # ルーティング後は scope["route"] にマッチしたルートが入る (パスの種類を増やさない)
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            method = scope.get("method", "")
+            http_request_duration.observe(time.perf_counter() - start, method=method, route=route_path)
+            http_requests.inc(method=method, route=route_path, status=status["code"])
@@ -0,0 +1,123 @@
+import hashlib
+import json
+from datetime import datetime, timezone
+from decimal import Decimal
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Callable
+from fastapi.responses import JSONResponse, Response
+from utils import metrics
+from utils.cache import TTLCache
+
+try:
+    import orjson
+except ImportError:  # orjson が無い環境では標準ライブラリで出力する
+    orjson = None
+
+
+def _default(value):
+    """orjson / json が直接扱えない型の変換"""
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if isinstance(value, Decimal):
+        return float(value)
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    raise TypeError(f"JSONに変換できない型です: {type(value).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    """UTF-8のままの (\\uXXXX にしない) コンパクトなJSON"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        content,
+        ensure_ascii=False,
+        separators=(",", ":"),
+        default=_default
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """アプリ共通のJSONレスポンス (charset を明示し、orjson があれば使う)"""
+
+    media_type = "application/json; charset=utf-8"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+# ========================================
+# 条件付きGET (ETag / Last-Modified)
+# ========================================
+
+# ユーザーごとの描画・シリアライズ結果 (ETag が同じ間は使い回す)
+versioned_cache = TTLCache(maxsize=2000, ttl=300)
+metrics.register_cache("versioned_responses", versioned_cache)
+
+# テンプレート・アセットの指紋 (起動時に設定。デプロイで見た目が変われば行が同じでも ETag が変わる)
+_etag_fingerprint = ""
+
+
+def set_etag_fingerprint(fingerprint: str):
+    """versioned_response の ETag に混ぜる指紋を設定"""
+    global _etag_fingerprint
+    _etag_fingerprint = fingerprint
+
+
+def etag_matches(request, etag: str) -> bool:
+    """If-None-Match が ETag と一致するか (弱い比較)"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [value.strip() for value in header.split(",")]
+    target = etag.removeprefix("W/")
+    return "*" in candidates or target in (value.removeprefix("W/") for value in candidates)
+
+
+def _parse_timestamp(value):
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.replace(microsecond=0)
+
+
+def _not_modified_since(request, last_modified) -> bool:
+    """If-Modified-Since 以降に更新が無いか (If-None-Match がある場合はそちらを優先)"""
+    header = request.headers.get("if-modified-since")
+    if not header or last_modified is None or "if-none-match" in request.headers:
+        return False
+    try:
+        return last_modified <= parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+
+
+def versioned_response(request, key, version: str, render: Callable[[], bytes],
+                       media_type: str, updated_at=None) -> Response:
+    """行バージョンから ETag / Last-Modified を付けたレスポンス
+
+    一致する If-None-Match (または If-Modified-Since) には render を呼ばずに 304 を返す。
+    バージョンが変わっていなければ前回の本文を使い回す。
+    ユーザーごとの内容なので弱い ETag にしている (圧縮は動的レスポンスと同じ軽い設定になる)。
+    """
+    etag = 'W/"' + hashlib.sha256(
+        f"{_etag_fingerprint}:{key}:{version}".encode("utf-8")
+    ).hexdigest()[:32] + '"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    last_modified = _parse_timestamp(updated_at) if updated_at else None
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+
+    if etag_matches(request, etag) or _not_modified_since(request, last_modified):
+        return Response(status_code=304, headers=headers)
+
+    cached = versioned_cache.get(key)
+    if cached is not None and cached[0] == etag:
+        body = cached[1]
+    else:
+        body = render()
+        versioned_cache.set(key, (etag, body))
+    return Response(body, media_type=media_type, headers=headers)
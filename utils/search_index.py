@@ -0,0 +1,100 @@
+import bisect
+import threading
+import unicodedata
+from collections import defaultdict
+
+
+def normalize_text(text) -> str:
+    """検索用に正規化 (全角/半角・大文字/小文字を同一視)"""
+    return unicodedata.normalize("NFKC", str(text or "")).lower()
+
+
+def bigrams(text: str) -> set:
+    """文字バイグラムの集合 (分かち書き不要なので日本語にも使える)"""
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+class NgramIndex:
+    """文字バイグラムによる全文検索インデックス
+
+    候補をバイグラムの積集合で絞り込み、最後に部分一致で確認するため誤検出はない。
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.docs = {}
+        self._ids = []
+        self.postings = defaultdict(set)
+        self.loaded = False
+        self.max_id = 0
+
+    def add(self, doc_id, text, **fields):
+        """文書を登録 (fields は絞り込み用の属性)"""
+        normalized = normalize_text(text)
+        with self._lock:
+            if doc_id in self.docs:
+                self.remove(doc_id)
+            self.docs[doc_id] = (normalized, fields)
+            bisect.insort(self._ids, doc_id)
+            for gram in bigrams(normalized):
+                self.postings[gram].add(doc_id)
+            self.max_id = max(self.max_id, doc_id)
+
+    def remove(self, doc_id):
+        """文書を削除"""
+        with self._lock:
+            entry = self.docs.pop(doc_id, None)
+            if entry is None:
+                return
+            i = bisect.bisect_left(self._ids, doc_id)
+            if i < len(self._ids) and self._ids[i] == doc_id:
+                del self._ids[i]
+            for gram in bigrams(entry[0]):
+                self.postings[gram].discard(doc_id)
+                if not self.postings[gram]:
+                    del self.postings[gram]
+
+    def search(self, keyword, filter_fn=None) -> list:
+        """キーワードを含む文書IDを新しい順に返す
+
+        filter_fn(fields) が False を返す文書は除外する。
+        """
+        query = normalize_text(keyword).strip()
+        with self._lock:
+            grams = bigrams(query)
+            if grams:
+                # 出現数の少ないバイグラムから積集合をとる
+                candidates = None
+                for gram in sorted(grams, key=lambda g: len(self.postings.get(g, ()))):
+                    ids = self.postings.get(gram)
+                    if not ids:
+                        return []
+                    candidates = set(ids) if candidates is None else candidates & ids
+                    if not candidates:
+                        return []
+                ids = sorted(candidates, reverse=True)
+            else:
+                # 1文字以下の検索語は全件を確認する
+                ids = reversed(self._ids)
+
+            results = []
+            for doc_id in ids:
+                text, fields = self.docs[doc_id]
+                if query and query not in text:
+                    continue
+                if filter_fn is not None and not filter_fn(fields):
+                    continue
+                results.append(doc_id)
+            return results
+
+    def clear(self):
+        """全件削除"""
+        with self._lock:
+            self.docs.clear()
+            self._ids.clear()
+            self.postings.clear()
+            self.loaded = False
+            self.max_id = 0
+
+    def __len__(self):
+        return len(self.docs)
@@ -0,0 +1,148 @@
+import bisect
+import threading
+from collections import Counter
+from datetime import datetime
+
+# ゴールド分布の区切り (各区間の下限)
+GOLD_BUCKETS = (0, 100, 1000, 10000, 100000, 1000000)
+
+
+def gold_bucket(gold) -> int:
+    """ゴールド量が属する区間の番号"""
+    try:
+        gold = int(gold or 0)
+    except (TypeError, ValueError):
+        gold = 0
+    return max(0, bisect.bisect_right(GOLD_BUCKETS, gold) - 1)
+
+
+class AdminStats:
+    """管理画面用の集計値 (書き込みのたびに差分更新し、定期的にDBと突き合わせる)
+
+    差分を正しく計算するため、プレイヤーごとに集計対象の列だけを保持する。
+    """
+
+    TRACKED_FIELDS = ("gold", "bot_banned", "web_banned")
+
+    def __init__(self, open_statuses=("pending", "receiver_accepted")):
+        self._lock = threading.Lock()
+        self.open_statuses = tuple(open_statuses)
+        self._players = {}
+        self._open_trades = {}
+        self._reset_counters()
+        self.loaded = False
+        self.reconciled_at = None
+
+    def _reset_counters(self):
+        self.player_count = 0
+        self.bot_banned = 0
+        self.web_banned = 0
+        self.gold_total = 0
+        self.gold_histogram = [0] * len(GOLD_BUCKETS)
+        self.trade_status = Counter()
+
+    @staticmethod
+    def _row(player: dict) -> tuple:
+        try:
+            gold = int(player.get("gold") or 0)
+        except (TypeError, ValueError):
+            gold = 0
+        return (gold, bool(player.get("bot_banned")), bool(player.get("web_banned")))
+
+    def _apply(self, row: tuple, sign: int):
+        gold, bot_banned, web_banned = row
+        self.player_count += sign
+        self.bot_banned += sign * bot_banned
+        self.web_banned += sign * web_banned
+        self.gold_total += sign * gold
+        self.gold_histogram[gold_bucket(gold)] += sign
+
+    # ---- プレイヤー ----
+
+    def set_player(self, user_id, player: dict):
+        """プレイヤー行を登録・置き換え"""
+        key = str(user_id)
+        row = self._row(player)
+        with self._lock:
+            old = self._players.get(key)
+            if old is not None:
+                self._apply(old, -1)
+            self._players[key] = row
+            self._apply(row, 1)
+
+    def update_player(self, user_id, fields: dict):
+        """更新された列だけを反映 (未把握のプレイヤーは次回の突き合わせに任せる)"""
+        if not any(field in fields for field in self.TRACKED_FIELDS):
+            return
+        key = str(user_id)
+        with self._lock:
+            old = self._players.get(key)
+            if old is None:
+                return
+            merged = dict(zip(self.TRACKED_FIELDS, old))
+            merged.update({field: fields[field] for field in self.TRACKED_FIELDS if field in fields})
+            row = self._row(merged)
+            self._apply(old, -1)
+            self._players[key] = row
+            self._apply(row, 1)
+
+    def remove_player(self, user_id):
+        """プレイヤーを削除"""
+        with self._lock:
+            old = self._players.pop(str(user_id), None)
+            if old is not None:
+                self._apply(old, -1)
+
+    # ---- トレード ----
+
+    def set_trade_status(self, trade_id, status):
+        """トレードのステータス変更を反映 (進行中のものだけを数える)"""
+        with self._lock:
+            old = self._open_trades.pop(trade_id, None)
+            if old is not None:
+                self.trade_status[old] -= 1
+            if status in self.open_statuses:
+                self._open_trades[trade_id] = status
+                self.trade_status[status] += 1
+
+    # ---- 突き合わせ ----
+
+    def reconcile(self, players, open_trades):
+        """DBから読み直した値で全体を置き換え (players・open_trades は1行ずつ読めればよい)"""
+        stats = AdminStats(self.open_statuses)
+        for player in players:
+            stats.set_player(player.get("user_id"), player)
+        for trade in open_trades:
+            stats.set_trade_status(trade.get("id"), trade.get("status"))
+
+        with self._lock:
+            self._players = stats._players
+            self._open_trades = stats._open_trades
+            self.player_count = stats.player_count
+            self.bot_banned = stats.bot_banned
+            self.web_banned = stats.web_banned
+            self.gold_total = stats.gold_total
+            self.gold_histogram = stats.gold_histogram
+            self.trade_status = stats.trade_status
+            self.loaded = True
+            self.reconciled_at = datetime.utcnow()
+
+    def snapshot(self) -> dict:
+        """テンプレート表示用の集計値"""
+        with self._lock:
+            labels = [
+                f"{low:,}〜{GOLD_BUCKETS[i + 1] - 1:,}" if i + 1 < len(GOLD_BUCKETS) else f"{low:,}〜"
+                for i, low in enumerate(GOLD_BUCKETS)
+            ]
+            return {
+                "loaded": self.loaded,
+                "player_count": self.player_count,
+                "bot_banned": self.bot_banned,
+                "web_banned": self.web_banned,
+                "gold_total": self.gold_total,
+                "gold_average": self.gold_total // self.player_count if self.player_count else 0,
+                "gold_histogram": list(zip(labels, self.gold_histogram)),
+                "open_trades": sum(self.trade_status.values()),
+                "trade_status": {status: self.trade_status[status] for status in self.open_statuses},
+                "reconciled_at": self.reconciled_at.isoformat() if self.reconciled_at else None
+            }
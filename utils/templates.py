@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from fastapi.templating import Jinja2Templates
+from fastapi.responses import Response
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
+from utils import metrics
+from utils.responses import etag_matches
+from utils.assets import load_manifest, stylesheets
+
+TEMPLATE_DIR = "templates"
+
+# テンプレートの変更を自動で読み直すか (開発時のみ TEMPLATE_AUTO_RELOAD=1 にする)
+AUTO_RELOAD = os.getenv("TEMPLATE_AUTO_RELOAD", "").lower() in ("1", "true", "yes")
+
+# コンパイル済みバイトコードの保存先 (ソースのチェックサムで照合されるため、デプロイで古いものは使われない)
+BYTECODE_CACHE_DIR = os.getenv(
+    "TEMPLATE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "rpg_web_jinja_cache")
+)
+
+
+def _bytecode_cache():
+    try:
+        os.makedirs(BYTECODE_CACHE_DIR, exist_ok=True)
+        return FileSystemBytecodeCache(BYTECODE_CACHE_DIR)
+    except OSError as e:
+        print(f"⚠️ テンプレートのバイトコードキャッシュを使用できません: {e}")
+        return None
+
+
+def create_environment() -> Environment:
+    """アプリ共通の Jinja2 環境"""
+    env = Environment(
+        loader=FileSystemLoader(TEMPLATE_DIR),
+        autoescape=True,
+        auto_reload=AUTO_RELOAD,
+        bytecode_cache=_bytecode_cache(),
+        # テンプレート数は少ないので全件をメモリに保持する
+        cache_size=-1
+    )
+    # CSSバンドルの <link> タグ (ビルド済みならハッシュ付きファイル名)
+    env.globals["stylesheets"] = stylesheets
+    return env
+
+
+# 全ルーターとミドルウェアで共有するテンプレート
+templates = Jinja2Templates(env=create_environment())
+
+
+def template_fingerprint() -> str:
+    """テンプレートのソースとCSSバンドルのファイル名から指紋を作る (条件付きGETの ETag 用)"""
+    digest = hashlib.sha256()
+    for name in sorted(templates.env.list_templates(extensions=["html"])):
+        source, _, _ = templates.env.loader.get_source(templates.env, name)
+        digest.update(name.encode("utf-8"))
+        digest.update(source.encode("utf-8"))
+    digest.update(json.dumps(load_manifest().get("files", {}), sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def precompile_templates() -> int:
+    """全テンプレートを読み込んでコンパイルしておく (コンパイルできた件数を返す)"""
+    compiled = 0
+    for name in templates.env.list_templates(extensions=["html"]):
+        try:
+            templates.env.get_template(name)
+            compiled += 1
+        except Exception as e:
+            print(f"⚠️ テンプレートのコンパイルに失敗しました ({name}): {e}")
+    return compiled
+
+
+# ========================================
+# 描画結果のキャッシュ (文脈に依存しないページ用)
+# ========================================
+
+class PageCache:
+    """テンプレートと表示の分岐 (ログイン有無など) ごとに描画結果と ETag を保持
+
+    プロセス内のみに保持するため、デプロイ (再起動) で自動的に破棄される。
+    ETag は本文のハッシュなので、内容が変われば必ず変わる。
+    """
+
+    def __init__(self):
+        self._pages = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_render(self, name: str, variants: dict) -> tuple:
+        key = (name, tuple(sorted(variants.items())))
+        page = self._pages.get(key)
+        if page is not None and not AUTO_RELOAD:
+            self.hits += 1
+            return page
+
+        self.misses += 1
+        body = templates.env.get_template(name).render(**variants).encode("utf-8")
+        page = (body, '"' + hashlib.sha256(body).hexdigest()[:32] + '"')
+        with self._lock:
+            self._pages[key] = page
+        return page
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+
+
+page_cache = PageCache()
+metrics.register_cache("pages", page_cache)
+
+
+def render_cached_page(request, name: str, status_code: int = 200, **variants) -> Response:
+    """キャッシュ済みの描画結果を返す (ETag 一致時は 304)
+
+    variants には出力を分岐させる値だけを渡す。
+    テンプレートが値そのものを表示しないこと (discord_id は有無だけを使う) が前提。
+    """
+    body, etag = page_cache.get_or_render(name, variants)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if status_code == 200 and etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, status_code=status_code, media_type="text/html; charset=utf-8", headers=headers)
@@ -0,0 +1,128 @@
+import os
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# DB_TRACE: off (既定) / on (Server-Timing ヘッダーとN+1の警告) / debug (全クエリを出力)
+TRACE_MODE = os.getenv("DB_TRACE", "off").lower()
+
+# 同じ形のクエリ (値違い) がこの回数以上あれば行ごとの問い合わせとみなす
+PER_ROW_THRESHOLD = 3
+
+_current = ContextVar("db_trace", default=None)
+
+
+def current_trace():
+    """実行中のリクエストのトレース (無効時・リクエスト外は None)"""
+    return _current.get()
+
+
+def _format_call(name, args, with_values=True) -> str:
+    if not args:
+        return f"{name}()"
+    if with_values:
+        return f"{name}({', '.join(repr(arg) for arg in args)})"
+    # 値を除いた形 (最初の引数は列名)
+    return f"{name}({args[0]!r})" if isinstance(args[0], str) else f"{name}(...)"
+
+
+class QueryTrace:
+    """1リクエスト分のDB問い合わせ記録"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.queries = []
+        self.started = time.perf_counter()
+
+    def record(self, table, operation, calls, duration, rows):
+        self.queries.append({
+            "table": table,
+            "operation": operation,
+            "filters": " ".join(_format_call(name, args) for name, args in calls),
+            "shape": " ".join(_format_call(name, args, with_values=False) for name, args in calls),
+            "duration": duration,
+            "rows": rows
+        })
+
+    @property
+    def total_duration(self) -> float:
+        return sum(query["duration"] for query in self.queries)
+
+    def problems(self) -> list:
+        """同一クエリの繰り返しと行ごとの問い合わせ (N+1) を検出"""
+        found = []
+        identical = Counter((q["table"], q["operation"], q["filters"]) for q in self.queries)
+        for (table, operation, filters), count in identical.items():
+            if count > 1:
+                found.append(f"同一クエリ x{count}: {table}.{operation} {filters}")
+
+        shapes = {}
+        for q in self.queries:
+            shapes.setdefault((q["table"], q["operation"], q["shape"]), set()).add(q["filters"])
+        for (table, operation, shape), variants in shapes.items():
+            count = sum(identical[(table, operation, filters)] for filters in variants)
+            if count >= PER_ROW_THRESHOLD and len(variants) > 1:
+                found.append(f"行ごとの問い合わせ x{count}: {table}.{operation} {shape}")
+        return found
+
+    def server_timing(self) -> str:
+        """Server-Timing ヘッダーの値"""
+        return f'db;dur={self.total_duration * 1000:.1f};desc="{len(self.queries)} queries"'
+
+    def report(self):
+        """デバッグ用の概要を出力"""
+        problems = self.problems()
+        if TRACE_MODE == "debug":
+            print(f"[DB] {self.name}: {len(self.queries)}件 {self.total_duration * 1000:.1f}ms")
+            for query in self.queries:
+                print(
+                    f"[DB]   {query['duration'] * 1000:7.1f}ms {query['rows']:>5}行 "
+                    f"{query['table']}.{query['operation']} {query['filters']}"
+                )
+        for problem in problems:
+            print(f"⚠️ [DB] {self.name}: {problem}")
+
+
+@contextmanager
+def traced(name: str):
+    """リクエスト外の処理 (定期タスクなど) をトレース"""
+    if TRACE_MODE == "off":
+        yield None
+        return
+    trace = QueryTrace(name)
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+        trace.report()
+
+
+class QueryTraceMiddleware:
+    """リクエストごとにDB問い合わせを記録し Server-Timing ヘッダーを付ける ASGI ミドルウェア"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or TRACE_MODE == "off":
+            await self.app(scope, receive, send)
+            return
+
+        trace = QueryTrace(f"{scope.get('method', '')} {scope.get('path', '')}")
+        token = _current.set(trace)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", trace.server_timing().encode("latin-1")))
+                headers.append((b"x-db-queries", str(len(trace.queries)).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            trace.report()
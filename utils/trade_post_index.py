@@ -0,0 +1,251 @@
+import bisect
+import heapq
+import re
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+# 希望アイテム欄 (自由入力) の区切り文字
+_ITEM_SEPARATORS = re.compile(r"[、,，/／\n]+")
+
+
+def normalize_item_name(name) -> str:
+    """アイテム名を索引用に正規化"""
+    return str(name).strip().lower() if name else ""
+
+
+def parse_timestamp(value):
+    """ISO形式の日時文字列をタイムゾーンなしのUTC datetimeに変換"""
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        try:
+            parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def split_item_names(items) -> list:
+    """アイテム名のリスト、または区切り文字入りの文字列をアイテム名リストに分解"""
+    if not items:
+        return []
+    if isinstance(items, str):
+        items = _ITEM_SEPARATORS.split(items)
+    names = []
+    for item in items:
+        name = str(item).strip()
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+class TradePostIndex:
+    """トレード募集投稿の転置インデックス (アイテム名/投稿者 -> 投稿ID)
+
+    期限切れの投稿は検索結果から除外し、pop_expired で期限順に取り出せる。
+    expires_at の無い投稿は created_at + default_ttl を期限とみなす。
+    """
+
+    def __init__(self, default_ttl: timedelta = None):
+        self._lock = threading.RLock()
+        self.default_ttl = default_ttl
+        self.posts = {}
+        self._ids = []
+        self._expiry = {}
+        self._expiry_heap = []
+        self.by_offering = defaultdict(set)
+        self.by_wanting = defaultdict(set)
+        self.by_user = defaultdict(set)
+        self.loaded = False
+        self.max_id = 0
+
+    def _expires_at(self, post: dict):
+        expires_at = parse_timestamp(post.get("expires_at"))
+        if expires_at is None and self.default_ttl is not None:
+            created_at = parse_timestamp(post.get("created_at"))
+            if created_at is not None:
+                expires_at = created_at + self.default_ttl
+        return expires_at
+
+    def _is_live(self, post_id, now) -> bool:
+        expires_at = self._expiry.get(post_id)
+        return expires_at is None or expires_at > now
+
+    def add(self, post: dict):
+        """投稿を登録 (同じIDがあれば置き換え)"""
+        post_id = post.get("id")
+        if post_id is None:
+            return
+        with self._lock:
+            if post_id in self.posts:
+                self._unlink(post_id)
+
+            self.posts[post_id] = post
+            bisect.insort(self._ids, post_id)
+            for name in split_item_names(post.get("offering_items")):
+                self.by_offering[normalize_item_name(name)].add(post_id)
+            for name in split_item_names(post.get("wanting_items")):
+                self.by_wanting[normalize_item_name(name)].add(post_id)
+            self.by_user[str(post.get("user_id"))].add(post_id)
+            self.max_id = max(self.max_id, post_id)
+
+            expires_at = self._expires_at(post)
+            if expires_at is not None:
+                self._expiry[post_id] = expires_at
+                heapq.heappush(self._expiry_heap, (expires_at, post_id))
+
+    def remove(self, post_id):
+        """投稿を削除"""
+        with self._lock:
+            if post_id in self.posts:
+                self._unlink(post_id)
+
+    def _unlink(self, post_id):
+        post = self.posts.pop(post_id)
+        # 期限ヒープの要素は pop_expired で取り出す際に読み捨てる
+        self._expiry.pop(post_id, None)
+        i = bisect.bisect_left(self._ids, post_id)
+        if i < len(self._ids) and self._ids[i] == post_id:
+            del self._ids[i]
+        for index, items in (
+            (self.by_offering, post.get("offering_items")),
+            (self.by_wanting, post.get("wanting_items")),
+        ):
+            for name in split_item_names(items):
+                key = normalize_item_name(name)
+                index[key].discard(post_id)
+                if not index[key]:
+                    del index[key]
+        user_key = str(post.get("user_id"))
+        self.by_user[user_key].discard(post_id)
+        if not self.by_user[user_key]:
+            del self.by_user[user_key]
+
+    def get(self, post_id):
+        """IDで投稿を取得"""
+        return self.posts.get(post_id)
+
+    def search(self, offering=None, wanting=None, poster=None, before_id=None, limit=None) -> list:
+        """条件に一致する投稿を新しい順に取得 (before_id より古いもののみ)"""
+        now = datetime.utcnow()
+        with self._lock:
+            candidates = None
+            for index, key in (
+                (self.by_offering, normalize_item_name(offering)),
+                (self.by_wanting, normalize_item_name(wanting)),
+                (self.by_user, str(poster) if poster else ""),
+            ):
+                if not key:
+                    continue
+                ids = index.get(key, set())
+                candidates = set(ids) if candidates is None else candidates & ids
+                if not candidates:
+                    return []
+
+            if candidates is None:
+                # 絞り込みなし: ソート済みIDの末尾から期限内のものを取り出す
+                end = len(self._ids) if before_id is None else bisect.bisect_left(self._ids, before_id)
+                ids = []
+                for i in range(end - 1, -1, -1):
+                    if limit is not None and len(ids) >= limit:
+                        break
+                    if self._is_live(self._ids[i], now):
+                        ids.append(self._ids[i])
+            else:
+                candidates = [
+                    post_id for post_id in candidates
+                    if (before_id is None or post_id < before_id) and self._is_live(post_id, now)
+                ]
+                if limit is None:
+                    ids = sorted(candidates, reverse=True)
+                else:
+                    ids = heapq.nlargest(limit, candidates)
+
+            return [self.posts[post_id] for post_id in ids]
+
+    def match(self, have_items, wish_items=None, exclude_user=None, limit=20) -> list:
+        """所持アイテムを希望し、欲しいアイテムを提供している投稿を一致数の多い順に取得
+
+        wish_items が空の場合は希望アイテムの一致だけで判定する。
+        """
+        have = {normalize_item_name(name): name for name in split_item_names(have_items)}
+        wish = {normalize_item_name(name): name for name in split_item_names(wish_items)}
+        now = datetime.utcnow()
+
+        with self._lock:
+            wanted_hits = defaultdict(list)
+            for key, name in have.items():
+                for post_id in self.by_wanting.get(key, ()):
+                    wanted_hits[post_id].append(name)
+
+            offered_hits = defaultdict(list)
+            for key, name in wish.items():
+                for post_id in self.by_offering.get(key, ()):
+                    if post_id in wanted_hits:
+                        offered_hits[post_id].append(name)
+
+            candidates = offered_hits if wish else wanted_hits
+            if exclude_user is not None:
+                excluded = self.by_user.get(str(exclude_user), set())
+            else:
+                excluded = set()
+
+            ranked = heapq.nlargest(
+                limit,
+                (
+                    post_id for post_id in candidates
+                    if post_id not in excluded and self._is_live(post_id, now)
+                ),
+                key=lambda post_id: (
+                    len(wanted_hits[post_id]) + len(offered_hits.get(post_id, ())),
+                    post_id
+                )
+            )
+
+            return [
+                {
+                    "post": self.posts[post_id],
+                    "score": len(wanted_hits[post_id]) + len(offered_hits.get(post_id, ())),
+                    "matched_wanting": wanted_hits[post_id],
+                    "matched_offering": offered_hits.get(post_id, [])
+                }
+                for post_id in ranked
+            ]
+
+    def pop_expired(self, now=None, limit=None) -> list:
+        """期限切れの投稿を期限の古い順に索引から取り除いて返す"""
+        now = now or datetime.utcnow()
+        expired = []
+        with self._lock:
+            while self._expiry_heap and (limit is None or len(expired) < limit):
+                expires_at, post_id = self._expiry_heap[0]
+                if expires_at > now:
+                    break
+                heapq.heappop(self._expiry_heap)
+                # 削除済み・期限が更新された投稿の古い要素は読み捨てる
+                if self._expiry.get(post_id) != expires_at:
+                    continue
+                expired.append(self.posts[post_id])
+                self._unlink(post_id)
+        return expired
+
+    def clear(self):
+        """全件削除"""
+        with self._lock:
+            self.posts.clear()
+            self._ids.clear()
+            self._expiry.clear()
+            self._expiry_heap.clear()
+            self.by_offering.clear()
+            self.by_wanting.clear()
+            self.by_user.clear()
+            self.loaded = False
+            self.max_id = 0
+
+    def __len__(self):
+        return len(self.posts)